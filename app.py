@@ -4,9 +4,26 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import datetime
 import pandas as pd
-import random
+import json
+from types import MappingProxyType
 import webbrowser
 import time
+import os
+import logging
+import queue
+import threading
+import itertools
+import functools
+import heapq
+import bisect
+import sqlite3
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict, deque
+from payments import PaymentClient, PaymentLedger
+from resumes import SKILL_KEYWORDS, CandidateMatcher, CandidateStore, ResumeIngestor, extract_skills, spool_upload
+
+logger = logging.getLogger(__name__)
 
 # Initialize session state
 if 'page' not in st.session_state:
@@ -20,41 +37,10 @@ PHONE = "+1 (404) 969-6618"
 ADDRESS = "3380 Peachtree Rd NE, Atlanta, GA 30326"
 
 # Sample data
-TRAINING_COURSES = {
-    "Operating Systems": [
-        "Unix: Solaris 11, AIX (7.1 - 7.3)",
-        "Linux: Ubuntu (20.04, 22.04), Rocky Linux (8, 9)",
-        "Windows Administration"
-    ],
-    "Databases": [
-        "Oracle (19c, 23c)", 
-        "MySQL (5.7, 8.0)", 
-        "PostgreSQL (11-16)", 
-        "DB2 (Version 11)", 
-        "SQL Server",
-        "MongoDB", 
-        "Cassandra"
-    ],
-    "DevOps": [
-        "DevOps Fundamentals", 
-        "Docker", 
-        "Kubernetes", 
-        "Terraform", 
-        "Ansible"
-    ],
-    "Cloud": [
-        "AWS Essentials", 
-        "AWS Security", 
-        "AWS DevOps", 
-        "AWS Infrastructure as Code"
-    ],
-    "SQL": [
-        "SQL on MySQL", 
-        "SQL on PostgreSQL", 
-        "SQL on Oracle (12c, 19c, 23c)", 
-        "SQL on MSSQL"
-    ]
-}
+# Course catalog file; edit it to change courses without a restart
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "courses.json")
+# Uploaded resumes are spooled here before text extraction
+RESUME_DIR = os.getenv("RESUME_DIR", ".resumes")
 
 CONSULTING_SERVICES = [
     "Database Design & Implementation",
@@ -80,6 +66,19 @@ JOB_CATEGORIES = [
     "SQL Developer"
 ]
 
+# Skills each role implies when an employer hires for it
+ROLE_SKILLS = {
+    "Unix System Administrator": ["Unix", "Bash", "Linux"],
+    "Linux System Administrator": ["Linux", "Bash", "Python"],
+    "Oracle DBA": ["Oracle", "SQL", "Linux"],
+    "MySQL DBA": ["MySQL", "SQL", "Linux"],
+    "PostgreSQL DBA": ["PostgreSQL", "SQL", "Linux"],
+    "DevOps Engineer": ["Docker", "Kubernetes", "Terraform", "Ansible", "Jenkins", "CI/CD", "Git", "Python"],
+    "Kubernetes Engineer": ["Kubernetes", "Docker", "Linux", "Terraform"],
+    "Cloud Engineer (AWS)": ["AWS", "Terraform", "Linux", "Python", "Networking"],
+    "SQL Developer": ["SQL", "SQL Server", "Oracle", "PostgreSQL"]
+}
+
 # Email configuration (replace with your actual credentials)
 EMAIL_CONFIG = {
     'sender': 'your_email@example.com',
@@ -88,27 +87,403 @@ EMAIL_CONFIG = {
     'smtp_port': 587
 }
 
+# Internal notification digests: buffer for up to `window` seconds or
+# `max_items` notifications; urgent kinds are always sent immediately.
+# Buffered notifications are kept in DIGEST_DB so a restart does not drop them.
+# Set NOTIFY_DIGEST_WINDOW=0 to send every notification on its own.
+DIGEST_CONFIG = {
+    'window': int(os.getenv("NOTIFY_DIGEST_WINDOW", 300)),
+    'max_items': int(os.getenv("NOTIFY_DIGEST_MAX", 50)),
+    'urgent': ["booking", "hiring"]
+}
+
 # Utility functions
-def send_email(to_email, subject, body):
-    """Send an email using SMTP"""
+class ActivityLog:
+    """Append-only log of agent activity kept in numbered segment files.
+
+    ``record`` only stamps the event, adds it to a ring buffer of the latest
+    events and hands it to a queue, so callers never wait on disk. A writer
+    thread appends queued events to the current segment in batches and
+    starts a new segment once it reaches ``segment_bytes``. The time and
+    file offset of every ``index_every``-th event (and of the first event
+    in each segment) go into a sparse index, saved next to the segment, so
+    ``between`` seeks close to the start of a time range instead of reading
+    the whole log.
+    """
+
+    def __init__(self, directory, recent=200, segment_bytes=4 * 1024 * 1024, index_every=256):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.index_every = index_every
+        self.latest = deque(maxlen=recent)
+        self.pending = queue.SimpleQueue()
+        self.index_lock = threading.Lock()
+        # Sorted (time, segment number, offset) entries
+        self.index = []
+        self.segments = sorted(name[:-6] for name in os.listdir(directory) if name.endswith(".jsonl"))
+        self.last_time = 0.0
+        self.count = 0
+        for number, segment in enumerate(self.segments):
+            if os.path.exists(self._path(segment, ".idx")):
+                with open(self._path(segment, ".idx")) as f:
+                    for line in f:
+                        at, offset = line.split()
+                        self.index.append((float(at), number, int(offset)))
+        if self.segments:
+            self._recover(len(self.segments) - 1)
+        else:
+            self._rotate()
+        self.file = open(self._path(self.segments[-1], ".jsonl"), "ab")
+        threading.Thread(target=self._write, daemon=True).start()
+
+    def _path(self, segment, suffix):
+        return os.path.join(self.directory, segment + suffix)
+
+    def _recover(self, number):
+        """Reload the ring buffer from the newest segments and index the last one's unindexed tail"""
+        path = self._path(self.segments[number], ".jsonl")
+        indexed = self.index[-1][2] if self.index and self.index[-1][1] == number else -1
+        offset = 0
+        with open(path, "rb") as f, open(self._path(self.segments[number], ".idx"), "a") as idx:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                event = json.loads(line)
+                self.latest.append(event)
+                self.last_time = max(self.last_time, event["time"])
+                if offset > indexed and (offset == 0 or self.count % self.index_every == 0):
+                    self.index.append((event["time"], number, offset))
+                    idx.write(f"{event['time']} {offset}\n")
+                self.count += 1
+                offset += len(line)
+        # Drop a torn final write so new events start on a fresh line
+        with open(path, "r+b") as f:
+            f.truncate(offset)
+        # A segment that was just started may hold only a few events
+        for earlier in range(number - 1, -1, -1):
+            room = self.latest.maxlen - len(self.latest)
+            if room <= 0:
+                break
+            with open(self._path(self.segments[earlier], ".jsonl"), "rb") as f:
+                events = [json.loads(line) for line in f if line.endswith(b"\n")]
+            self.latest.extendleft(reversed(events[-room:]))
+
+    def _rotate(self):
+        self.segments.append(f"activity-{len(self.segments):06d}")
+        open(self._path(self.segments[-1], ".jsonl"), "ab").close()
+
+    def record(self, action, details=""):
+        """Log an event; safe to call from any thread"""
+        event = {"time": time.time(), "action": action, "details": details}
+        self.latest.append(event)
+        self.pending.put(event)
+
+    def recent(self, n=20):
+        """Latest ``n`` events, newest first"""
+        return list(self.latest)[::-1][:n]
+
+    def between(self, start, end):
+        """Events with ``start <= time <= end`` (timestamps), oldest first"""
+        with self.index_lock:
+            if not self.index:
+                return []
+            position = max(bisect.bisect_left(self.index, (start,)) - 1, 0)
+            _, number, offset = self.index[position]
+            segments = self.segments[number:]
+        events = []
+        for segment in segments:
+            with open(self._path(segment, ".jsonl"), "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    event = json.loads(line)
+                    if event["time"] > end:
+                        return events
+                    if event["time"] >= start:
+                        events.append(event)
+            offset = 0
+        return events
+
+    def _write(self):
+        while True:
+            batch = [self.pending.get()]
+            while True:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            entries = []
+            for event in batch:
+                if self.file.tell() >= self.segment_bytes:
+                    self._flush(entries)
+                    self.file.close()
+                    with self.index_lock:
+                        self._rotate()
+                    self.file = open(self._path(self.segments[-1], ".jsonl"), "ab")
+                # Keep the log in time order when concurrent callers race
+                event["time"] = self.last_time = max(event["time"], self.last_time)
+                offset = self.file.tell()
+                if offset == 0 or self.count % self.index_every == 0:
+                    entries.append((event["time"], len(self.segments) - 1, offset))
+                self.file.write(json.dumps(event).encode() + b"\n")
+                self.count += 1
+            self._flush(entries)
+
+    def _flush(self, entries):
+        self.file.flush()
+        if not entries:
+            return
+        with open(self._path(self.segments[-1], ".idx"), "a") as idx:
+            idx.writelines(f"{at} {offset}\n" for at, _, offset in entries)
+        with self.index_lock:
+            self.index.extend(entries)
+        entries.clear()
+
+@st.cache_resource
+def get_activity_log():
+    """Activity log shared by every session"""
+    return ActivityLog(os.getenv("ACTIVITY_DIR", ".activity_log"))
+
+def smtp_connect():
+    """Open an authenticated SMTP connection using EMAIL_CONFIG"""
+    server = smtplib.SMTP(EMAIL_CONFIG['smtp_server'], EMAIL_CONFIG['smtp_port'], timeout=30)
+    server.starttls()
+    server.login(EMAIL_CONFIG['sender'], EMAIL_CONFIG['password'])
+    return server
+
+class NotificationDispatcher:
+    """Deliver notification emails from background worker threads.
+
+    Forms call ``submit``, which only puts the message on a bounded queue
+    and returns a job id. Each worker keeps its own authenticated SMTP
+    connection open between messages, checking it with NOOP after it has
+    been idle and reconnecting when it has dropped. The status of the most
+    recent ``history`` jobs can be read back with ``status``; bulk sends
+    from ``submit_many`` report through a callback instead, so they never
+    push form users' jobs out of that history.
+    """
+
+    def __init__(self, connect, workers=2, max_queue=1000, idle_check=60, history=10000):
+        self.connect = connect
+        self.jobs = queue.Queue(maxsize=max_queue)
+        self.idle_check = idle_check
+        self.history = history
+        self.statuses = OrderedDict()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        for _ in range(workers):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def _set_status(self, job_id, status, members=()):
+        with self.lock:
+            for key in (job_id, *members):
+                self.statuses[key] = status
+            while len(self.statuses) > self.history:
+                self.statuses.popitem(last=False)
+
+    def reserve(self, status="queued"):
+        """Allocate a job id for a message that will be sent later"""
+        job_id = next(self.ids)
+        self._set_status(job_id, status)
+        return job_id
+
+    def submit(self, to_email, subject, body, members=(), block=False):
+        """Queue a message and return its job id.
+
+        Raises queue.Full when saturated, unless ``block`` is set, in which
+        case it waits for room. ``members`` are reserved job ids whose
+        status follows this message, such as the notifications folded into
+        a digest.
+        """
+        job_id = next(self.ids)
+        # Mark it queued first so a fast worker's result is not overwritten
+        with self.lock:
+            previous = {key: self.statuses.get(key) for key in members}
+        self._set_status(job_id, "queued", members)
+        try:
+            self.jobs.put((job_id, to_email, subject, body, members, None), block=block)
+        except queue.Full:
+            with self.lock:
+                self.statuses.pop(job_id, None)
+                self.statuses.update({key: status for key, status in previous.items() if status is not None})
+            raise
+        return job_id
+
+    def submit_many(self, messages, on_result=None):
+        """Queue ``(to_email, subject, body)`` messages without blocking the caller.
+
+        A feeder thread waits for queue space, so large batches never fail
+        with ``queue.Full``. The messages get no job ids or status history;
+        ``on_result(to_email, status)`` is called as each one finishes.
+        """
+        def feed():
+            for to_email, subject, body in messages:
+                self.jobs.put((None, to_email, subject, body, (), on_result))
+
+        threading.Thread(target=feed, daemon=True).start()
+
+    def status(self, job_id):
+        with self.lock:
+            return self.statuses.get(job_id, "unknown")
+
+    def _finish(self, job_id, to_email, members, on_result, status):
+        if on_result is None:
+            self._set_status(job_id, status, members)
+            return
+        try:
+            on_result(to_email, status)
+        except Exception:
+            logger.exception("Result callback failed for %s", to_email)
+
+    def _work(self):
+        server = None
+        last_used = 0.0
+        while True:
+            job_id, to_email, subject, body, members, on_result = self.jobs.get()
+            finish = functools.partial(self._finish, job_id, to_email, members, on_result)
+            msg = MIMEMultipart()
+            msg['From'] = EMAIL_CONFIG['sender']
+            msg['To'] = to_email
+            msg['Subject'] = subject
+            msg.attach(MIMEText(body, 'plain'))
+            for attempt in range(3):
+                try:
+                    if server is not None and time.monotonic() - last_used > self.idle_check:
+                        server.noop()
+                    if server is None:
+                        server = self.connect()
+                    server.sendmail(EMAIL_CONFIG['sender'], to_email, msg.as_string())
+                    last_used = time.monotonic()
+                    finish("sent")
+                    break
+                except OSError as e:
+                    # SMTPException subclasses OSError; only a broken transport
+                    # (disconnect, reset, timeout) is worth a reconnect
+                    if isinstance(e, smtplib.SMTPException) and not isinstance(e, smtplib.SMTPServerDisconnected):
+                        finish(f"failed: {e}")
+                        break
+                    if server is not None:
+                        try:
+                            server.close()
+                        except OSError:
+                            pass
+                    server = None
+                    if attempt == 2:
+                        finish(f"failed: {e}")
+                except Exception as e:
+                    finish(f"failed: {e}")
+                    break
+
+class NotificationDigest:
+    """Coalesce internal notifications into periodic digest emails.
+
+    Notifications are buffered and sent as one email when ``max_items``
+    have arrived or ``window`` seconds after the first buffered one,
+    whichever comes first. Kinds listed in ``urgent`` skip the buffer. The
+    flush thread sleeps until the next deadline rather than polling.
+
+    The buffer is kept in SQLite at ``path`` until each digest is handed to
+    the dispatcher, so notifications buffered before a restart are reloaded
+    and sent with the next digest.
+    """
+
+    def __init__(self, dispatcher, to_email, path, window=300, max_items=50, urgent=()):
+        self.dispatcher = dispatcher
+        self.to_email = to_email
+        self.window = window
+        self.max_items = max_items
+        self.urgent = set(urgent)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS digest_items (
+                id INTEGER PRIMARY KEY,
+                subject TEXT NOT NULL,
+                body TEXT NOT NULL,
+                created REAL NOT NULL
+            )
+        """)
+        rows = self.conn.execute("SELECT id, subject, body, created FROM digest_items ORDER BY id").fetchall()
+        self.buffer = [(dispatcher.reserve("waiting for digest"), row_id, subject, body)
+                       for row_id, subject, body, _ in rows]
+        # Items from before a restart keep the deadline of the oldest one
+        self.deadline = (time.monotonic() + max(0.0, rows[0][3] + window - time.time())) if rows else None
+        self.ready = threading.Condition()
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def add(self, kind, subject, body):
+        """Buffer a notification, or send it now if urgent; returns a job id"""
+        if kind in self.urgent:
+            return self.dispatcher.submit(self.to_email, subject, body)
+        job_id = self.dispatcher.reserve("waiting for digest")
+        with self.ready:
+            with self.conn:
+                row_id = self.conn.execute(
+                    "INSERT INTO digest_items (subject, body, created) VALUES (?, ?, ?)",
+                    (subject, body, time.time())
+                ).lastrowid
+            self.buffer.append((job_id, row_id, subject, body))
+            if self.deadline is None:
+                self.deadline = time.monotonic() + self.window
+            self.ready.notify()
+        return job_id
+
+    def _flush_loop(self):
+        while True:
+            with self.ready:
+                while not self.buffer or (len(self.buffer) < self.max_items
+                                          and time.monotonic() < self.deadline):
+                    timeout = None if not self.buffer else self.deadline - time.monotonic()
+                    self.ready.wait(timeout)
+                items = self.buffer[:self.max_items]
+                self.buffer = self.buffer[self.max_items:]
+                if not self.buffer:
+                    self.deadline = None
+            sections = [f"{subject}\n{'-' * len(subject)}\n{body.strip()}" for _, _, subject, body in items]
+            self.dispatcher.submit(
+                self.to_email,
+                f"Digest: {len(items)} new notification{'s' if len(items) != 1 else ''}",
+                "\n\n".join(sections),
+                members=[job_id for job_id, _, _, _ in items],
+                # Wait for room rather than lose the items already taken off the buffer
+                block=True
+            )
+            with self.ready, self.conn:
+                self.conn.executemany("DELETE FROM digest_items WHERE id = ?",
+                                      [(row_id,) for _, row_id, _, _ in items])
+
+@st.cache_resource
+def get_dispatcher():
+    """Notification dispatcher shared by every session"""
+    return NotificationDispatcher(smtp_connect)
+
+@st.cache_resource
+def get_digest():
+    """Digest buffer for mail to the internal inbox, or None when disabled"""
+    if DIGEST_CONFIG['window'] <= 0:
+        return None
+    return NotificationDigest(get_dispatcher(), EMAIL, os.getenv("DIGEST_DB", "sitm_digest.db"), **DIGEST_CONFIG)
+
+def send_email(to_email, subject, body, kind=None):
+    """Queue an email for background delivery.
+
+    Notifications to the internal inbox that carry a ``kind`` go through
+    the digest buffer when it is enabled.
+    """
     try:
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_CONFIG['sender']
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        server = smtplib.SMTP(EMAIL_CONFIG['smtp_server'], EMAIL_CONFIG['smtp_port'])
-        server.starttls()
-        server.login(EMAIL_CONFIG['sender'], EMAIL_CONFIG['password'])
-        text = msg.as_string()
-        server.sendmail(EMAIL_CONFIG['sender'], to_email, text)
-        server.quit()
-        return True
-    except Exception as e:
-        st.error(f"Failed to send email: {str(e)}")
+        digest = get_digest() if kind and to_email == EMAIL else None
+        if digest:
+            job_id = digest.add(kind, subject, body)
+        else:
+            job_id = get_dispatcher().submit(to_email, subject, body)
+    except queue.Full:
+        st.error("Failed to send email: notification queue is full")
         return False
+    st.session_state.setdefault('notifications', []).append((job_id, subject))
+    get_activity_log().record("Sent email", subject)
+    return True
 
 def generate_promo_text():
     """Generate promotional text in George Carlin style"""
@@ -120,20 +495,416 @@ def generate_promo_text():
     What are you waiting for? Book a session now before your current job puts you to sleep again!
     """
 
-def post_to_social_media(content):
-    """Simulate posting to social media"""
-    platforms = ["Twitter", "Facebook", "LinkedIn", "Instagram", "Reddit"]
-    for platform in platforms:
+SOCIAL_PLATFORMS = ["Twitter", "Facebook", "LinkedIn", "Instagram", "Reddit"]
+
+# Request timeout in seconds for each platform's publish call
+SOCIAL_TIMEOUTS = {
+    "Twitter": 5,
+    "Facebook": 10,
+    "LinkedIn": 10,
+    "Instagram": 15,
+    "Reddit": 10
+}
+
+def publish_to_platform(platform, content, retries=2):
+    """Publish one post, retrying transient failures with backoff.
+
+    Posts go to ``$SOCIAL_API_URL/<platform>``; without that setting the
+    API call is simulated.
+    """
+    base_url = os.getenv("SOCIAL_API_URL")
+    if not base_url:
         time.sleep(1)  # Simulate API delay
-        st.success(f"Posted to {platform}: {content[:50]}...")
-    return True
+        return
+    url = f"{base_url.rstrip('/')}/{platform.lower()}"
+    for attempt in range(retries + 1):
+        try:
+            response = requests.post(url, json={"content": content},
+                                     timeout=SOCIAL_TIMEOUTS.get(platform, 10))
+            response.raise_for_status()
+            return
+        except requests.RequestException as e:
+            # Only timeouts, dropped connections, rate limits and server errors are worth retrying
+            status = e.response.status_code if e.response is not None else None
+            transient = (isinstance(e, (requests.Timeout, requests.ConnectionError))
+                         or status == 429 or (status or 0) >= 500)
+            if not transient or attempt == retries:
+                raise
+            time.sleep(0.5 * 2 ** attempt)
+
+def fan_out_post(content, platforms, on_result=None):
+    """Publish to all platforms concurrently.
+
+    ``on_result(platform, error)`` is called from the caller's thread as
+    each platform finishes, so results can be shown in arrival order.
+    Returns ``{platform: error or None}``.
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, len(platforms))) as pool:
+        futures = {pool.submit(publish_to_platform, platform, content): platform for platform in platforms}
+        for future in as_completed(futures):
+            platform = futures[future]
+            results[platform] = future.exception()
+            if on_result:
+                on_result(platform, results[platform])
+    return results
 
-def create_payment_link(amount, installments=False):
-    """Generate a payment link (simulated)"""
-    if installments:
-        return f"https://payment.example.com/checkout?amount={amount}&plan=installment"
+def show_post_result(platform, error, content):
+    if error is None:
+        st.success(f"Posted to {platform}: {content[:50]}...")
     else:
-        return f"https://payment.example.com/checkout?amount={amount}"
+        st.error(f"Failed to post to {platform}: {error}")
+
+def post_to_social_media(content, platforms=SOCIAL_PLATFORMS):
+    """Post to every platform at once, reporting each result as it arrives"""
+    results = fan_out_post(content, platforms,
+                           lambda platform, error: show_post_result(platform, error, content))
+    posted = [platform for platform, error in results.items() if error is None]
+    if posted:
+        get_activity_log().record(f"Posted to {', '.join(posted)}", content[:50])
+    return len(posted) == len(results)
+
+class PostScheduler:
+    """Publish scheduled posts at their due time, surviving restarts.
+
+    Posts are stored in SQLite; only ``(due, id)`` pairs of queued posts are
+    kept in memory, in a heap. One worker thread sleeps until the earliest
+    due time (or until an earlier post is scheduled), then publishes every
+    post that is due in batches and records the outcome of each batch in
+    a single transaction. A batch that fails unexpectedly is logged and
+    put back on the heap to retry after ``retry_seconds``.
+    """
+
+    def __init__(self, path, batch_size=100, workers=8, activity=None, retry_seconds=60):
+        self.activity = activity
+        self.retry_seconds = retry_seconds
+        self.batch_size = batch_size
+        self.workers = workers
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS scheduled_posts (
+                id INTEGER PRIMARY KEY,
+                due REAL NOT NULL,
+                content TEXT NOT NULL,
+                platforms TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                error TEXT,
+                published REAL
+            );
+            CREATE INDEX IF NOT EXISTS scheduled_posts_status_due ON scheduled_posts (status, due);
+        """)
+        self.lock = threading.Condition()
+        self.heap = self.conn.execute(
+            "SELECT due, id FROM scheduled_posts WHERE status = 'queued'"
+        ).fetchall()
+        heapq.heapify(self.heap)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def schedule(self, due, content, platforms):
+        """Store a post to publish at ``due`` (a datetime) and return its id"""
+        timestamp = due.timestamp()
+        with self.lock:
+            with self.conn:
+                post_id = self.conn.execute(
+                    "INSERT INTO scheduled_posts (due, content, platforms) VALUES (?, ?, ?)",
+                    (timestamp, content, json.dumps(list(platforms)))
+                ).lastrowid
+            heapq.heappush(self.heap, (timestamp, post_id))
+            if self.heap[0][1] == post_id:
+                self.lock.notify()
+        return post_id
+
+    def stats(self):
+        with self.lock:
+            return {
+                "queued": len(self.heap),
+                "next_due": datetime.datetime.fromtimestamp(self.heap[0][0]) if self.heap else None
+            }
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while not self.heap or self.heap[0][0] > time.time():
+                    self.lock.wait(self.heap[0][0] - time.time() if self.heap else None)
+                due_ids = []
+                while self.heap and self.heap[0][0] <= time.time() and len(due_ids) < self.batch_size:
+                    due_ids.append(heapq.heappop(self.heap)[1])
+            try:
+                marks = ",".join("?" * len(due_ids))
+                with self.lock:
+                    posts = self.conn.execute(
+                        f"SELECT id, content, platforms FROM scheduled_posts WHERE id IN ({marks})",
+                        due_ids
+                    ).fetchall()
+                self._publish(posts)
+            except Exception:
+                logger.exception("Failed to publish %d scheduled posts; retrying in %ss",
+                                 len(due_ids), self.retry_seconds)
+                retry = time.time() + self.retry_seconds
+                with self.lock:
+                    for post_id in due_ids:
+                        heapq.heappush(self.heap, (retry, post_id))
+
+    def _publish(self, posts):
+        def publish(post):
+            post_id, content, platforms = post
+            results = fan_out_post(content, json.loads(platforms))
+            errors = [f"{platform}: {error}" for platform, error in results.items() if error]
+            return post_id, "; ".join(errors) or None
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            outcomes = list(pool.map(publish, posts))
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE scheduled_posts SET status = ?, error = ?, published = ? WHERE id = ?",
+                [("failed" if error else "published", error, now, post_id) for post_id, error in outcomes]
+            )
+        if self.activity:
+            failed = sum(1 for _, error in outcomes if error)
+            self.activity.record("Published scheduled posts",
+                                 f"{len(outcomes) - failed} published, {failed} failed")
+
+@st.cache_resource
+def get_scheduler():
+    """Post scheduler shared by every session"""
+    return PostScheduler(os.getenv("SCHEDULE_DB", "sitm_schedule.db"), activity=get_activity_log())
+
+# How long after the last contact each lead status is due a follow-up,
+# and how many follow-ups a lead gets before we stop
+FOLLOW_UP_RULES = {
+    "new": datetime.timedelta(days=1),
+    "contacted": datetime.timedelta(days=3)
+}
+MAX_FOLLOW_UPS = 3
+
+FOLLOW_UP_TEMPLATE = """Hi {name},
+
+Thanks again for your interest in {interest} with {company}.
+We help IT professionals reach six-figure roles in 90-120 days, and we'd love to show you how.
+
+Book a free assessment or reply to this email with any questions.
+
+{agent}
+{phone}
+"""
+
+class LeadStore:
+    """Prospective students and clients captured by the site's forms.
+
+    Leads are indexed on ``(status, last_contact)`` so selecting the ones
+    due for a follow-up is a range scan per status instead of a table scan.
+    Leads whose follow-up is still being delivered are held in ``sending``
+    and left out of the next selection.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.sending = set()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS leads (
+                email TEXT PRIMARY KEY,
+                name TEXT,
+                source TEXT,
+                interest TEXT,
+                status TEXT NOT NULL DEFAULT 'new',
+                last_contact REAL NOT NULL,
+                follow_ups INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS leads_status_last_contact ON leads (status, last_contact);
+        """)
+
+    def record(self, name, email, source, interest):
+        """Add or refresh a lead when it submits a form"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO leads (email, name, source, interest, last_contact) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (email) DO UPDATE SET name = excluded.name, source = excluded.source, "
+                "interest = excluded.interest, last_contact = excluded.last_contact",
+                (email.strip().lower(), name, source, interest, time.time())
+            )
+
+    def due_for_follow_up(self, now=None):
+        """Leads whose last contact is older than the delay for their status"""
+        now = now or time.time()
+        due = []
+        with self.lock:
+            for status, delay in FOLLOW_UP_RULES.items():
+                due += self.conn.execute(
+                    "SELECT email, name, interest FROM leads "
+                    "WHERE status = ? AND last_contact <= ? AND follow_ups < ?",
+                    (status, now - delay.total_seconds(), MAX_FOLLOW_UPS)
+                ).fetchall()
+            return [lead for lead in due if lead[0] not in self.sending]
+
+    def start_sending(self, emails):
+        with self.lock:
+            self.sending.update(emails)
+
+    def finish_sending(self, emails):
+        with self.lock:
+            self.sending.difference_update(emails)
+
+    def mark_contacted(self, emails, now=None):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE leads SET status = 'contacted', last_contact = ?, follow_ups = follow_ups + 1 "
+                "WHERE email = ?",
+                [(now or time.time(), email) for email in emails]
+            )
+
+def run_follow_ups(leads, dispatcher, batch_size=500):
+    """Select due leads, render their messages and queue them for delivery.
+
+    Leads are marked contacted as their follow-ups are delivered, in
+    batches of ``batch_size``; a lead whose follow-up fails stays due.
+    """
+    due = leads.due_for_follow_up()
+    subject = f"Your IT career with {COMPANY_NAME}"
+    messages = [
+        (email, subject, FOLLOW_UP_TEMPLATE.format(
+            name=name or "there", interest=interest or "our programs",
+            company=COMPANY_NAME, agent=AGENT_NAME, phone=PHONE))
+        for email, name, interest in due
+    ]
+    lock = threading.Lock()
+    remaining = len(messages)
+    finished, delivered = [], []
+
+    def on_result(email, status):
+        nonlocal remaining
+        with lock:
+            remaining -= 1
+            finished.append(email)
+            if status == "sent":
+                delivered.append(email)
+            if len(finished) < batch_size and remaining:
+                return
+            done, sent = finished[:], delivered[:]
+            finished.clear()
+            delivered.clear()
+        leads.mark_contacted(sent)
+        leads.finish_sending(done)
+
+    leads.start_sending([email for email, _, _ in due])
+    dispatcher.submit_many(messages, on_result)
+    get_activity_log().record("Sent emails", f"{len(messages)} follow-ups to leads")
+    return len(messages)
+
+@st.cache_resource
+def get_leads():
+    """Lead store shared by every session"""
+    return LeadStore(os.getenv("LEADS_DB", "sitm_leads.db"))
+
+@st.cache_resource
+def get_candidates():
+    """Candidate store shared by every session"""
+    return CandidateStore(os.getenv("CANDIDATES_DB", "sitm_candidates.db"))
+
+@st.cache_resource
+def get_matcher():
+    """Candidate matcher over every stored profile, shared by every session"""
+    matcher = CandidateMatcher(list(SKILL_KEYWORDS) + ["role:" + role for role in JOB_CATEGORIES])
+    for candidate_id, features in get_candidates().profiles():
+        matcher.add(candidate_id, features)
+    return matcher
+
+@st.cache_resource
+def get_resume_ingestor():
+    """Resume extraction pool shared by every session"""
+    candidates, matcher = get_candidates(), get_matcher()
+
+    def reindex(candidate_ids):
+        for candidate_id, features in candidates.profiles(candidate_ids):
+            matcher.add(candidate_id, features)
+
+    return ResumeIngestor(candidates, on_extracted=reindex)
+
+def save_candidate(resume=None, **candidate):
+    """Store a job seeker, queue their resume for extraction and add them to the matcher"""
+    path = spool_upload(resume, RESUME_DIR) if resume else None
+    candidate_id = get_candidates().save(resume_path=path, **candidate)
+    if path:
+        get_resume_ingestor().submit(candidate_id, path)
+    for candidate_id, features in get_candidates().profiles([candidate_id]):
+        get_matcher().add(candidate_id, features)
+    return candidate_id
+
+def match_candidates(target_roles, hiring_needs="", k=10):
+    """Top candidates for an employer's roles and free-text needs, as a DataFrame"""
+    query = {}
+    for role in target_roles:
+        query["role:" + role] = 1.0
+        for skill in ROLE_SKILLS.get(role, []):
+            query.setdefault(skill, 0.5)
+    for skill in extract_skills(hiring_needs):
+        query[skill] = 1.0
+    matches = get_matcher().top(query, k)
+    profiles = get_candidates().summaries([candidate_id for candidate_id, _ in matches])
+    return pd.DataFrame(
+        [{**profiles[candidate_id], "match": round(score * 100)} for candidate_id, score in matches
+         if candidate_id in profiles],
+        columns=["id", "name", "email", "current_role", "experience", "match"]
+    )
+
+@st.cache_resource
+def get_payment_ledger():
+    """Issued links and reconciled payments, shared by every session"""
+    return PaymentLedger(os.getenv("PAYMENTS_DB", "sitm_payments.db"))
+
+@st.cache_resource
+def get_payment_client():
+    """Shared payment client, or None when no provider is configured"""
+    if not os.getenv("PAYMENT_API_URL"):
+        return None
+    return PaymentClient(os.getenv("PAYMENT_API_URL"), os.getenv("PAYMENT_API_KEY", ""),
+                         ledger=get_payment_ledger())
+
+def create_payment_link(amount, installments=False, program="", customer=None):
+    """Generate a payment link, reusing the one already issued to this customer for this program and plan"""
+    client = get_payment_client()
+    if client is None:
+        if installments:
+            return f"https://payment.example.com/checkout?amount={amount}&plan=installment"
+        else:
+            return f"https://payment.example.com/checkout?amount={amount}"
+    plan = "installment" if installments else "full"
+    return client.create_link(amount, f"{plan.title()} payment for {program}", customer, program, plan)
+
+class CourseCatalog:
+    """Read-only view of courses.json with precomputed lookups.
+
+    ``grouped`` maps each category to a tuple of course names, ``flat`` is
+    every course name in catalog order and ``details`` maps a name to its
+    metadata. All views are immutable so one instance can be shared by
+    every session.
+    """
+
+    def __init__(self, path):
+        with open(path) as f:
+            data = json.load(f)
+        self.version = data.get("version")
+        self.grouped = MappingProxyType({
+            category: tuple(course["name"] for course in courses)
+            for category, courses in data["courses"].items()
+        })
+        self.flat = tuple(name for names in self.grouped.values() for name in names)
+        self.details = MappingProxyType({
+            course["name"]: MappingProxyType(dict(course, category=category))
+            for category, courses in data["courses"].items() for course in courses
+        })
+
+@st.cache_resource(max_entries=2)
+def load_catalog(path, mtime_ns):
+    """Build the catalog; the mtime argument makes a changed file a cache miss"""
+    return CourseCatalog(path)
+
+def get_catalog():
+    """Current course catalog, rebuilt only when courses.json changes"""
+    return load_catalog(CATALOG_PATH, os.stat(CATALOG_PATH).st_mtime_ns)
 
 # Page functions
 def home_page():
@@ -248,7 +1019,8 @@ def consulting_page():
                 Please follow up within 24 hours.
                 """
                 
-                if send_email(EMAIL, f"Consultation Request from {name}", email_body):
+                get_leads().record(name, email, "consultation", service)
+                if send_email(EMAIL, f"Consultation Request from {name}", email_body, kind="consultation"):
                     st.success("Request submitted! We'll contact you within 24 hours.")
                 else:
                     st.error("Failed to send request. Please try again or contact us directly.")
@@ -270,19 +1042,21 @@ def training_page():
     st.markdown("---")
     st.subheader("Our Training Categories")
     
+    catalog = get_catalog()
     selected_category = st.selectbox(
         "Select a training category to explore:",
-        list(TRAINING_COURSES.keys())
+        list(catalog.grouped.keys())
     )
     
     st.markdown(f"### {selected_category} Courses")
     
-    for course in TRAINING_COURSES[selected_category]:
+    for course in catalog.grouped[selected_category]:
+        details = catalog.details[course]
         with st.expander(course):
             st.markdown(f"""
-            **Duration:** {random.randint(4, 8)} weeks  
-            **Level:** {random.choice(["Beginner", "Intermediate", "Advanced"])}  
-            **Price:** ${random.randint(1000, 3500)} (payment plans available)
+            **Duration:** {details['duration_weeks']} weeks  
+            **Level:** {details['level']}  
+            **Price:** ${details['price']:,} (payment plans available)
             
             This comprehensive course will teach you everything you need to know about {course.split(':')[0]}.
             By the end, you'll be ready for high-paying roles in this technology.
@@ -313,7 +1087,7 @@ def training_page():
         phone = st.text_input("Phone Number")
         interest = st.selectbox(
             "Which program are you interested in?",
-            [course for courses in TRAINING_COURSES.values() for course in courses]
+            catalog.flat
         )
         schedule = st.radio(
             "Preferred schedule:",
@@ -336,7 +1110,8 @@ def training_page():
                 Please send more information about this program.
                 """
                 
-                if send_email(EMAIL, f"Training Interest from {name}", email_body):
+                get_leads().record(name, email, "training", interest)
+                if send_email(EMAIL, f"Training Interest from {name}", email_body, kind="training"):
                     st.success("Request received! We'll send you more information shortly.")
                 else:
                     st.error("Failed to send request. Please try again or contact us directly.")
@@ -398,11 +1173,13 @@ def recruiting_page():
                 "Roles you're interested in:",
                 JOB_CATEGORIES
             )
-            resume = st.file_uploader("Upload Resume (PDF or DOCX)")
+            resume = st.file_uploader("Upload Resume (PDF or DOCX)", type=["pdf", "docx"])
             
             submitted = st.form_submit_button("Submit Profile")
             if submitted:
                 if name and email and (skills or resume):
+                    save_candidate(resume, name=name, email=email, phone=phone, current_role=current_role,
+                                   experience=experience, skills=skills, target_roles=target_roles)
                     email_body = f"""
                     New job seeker profile: {name}
                     
@@ -415,10 +1192,10 @@ def recruiting_page():
                     Email: {email}
                     Phone: {phone}
                     
-                    Resume: {'Attached' if resume else 'Not provided'}
+                    Resume: {resume.name + ' (skills are being extracted)' if resume else 'Not provided'}
                     """
                     
-                    if send_email(EMAIL, f"Job Seeker Profile: {name}", email_body):
+                    if send_email(EMAIL, f"Job Seeker Profile: {name}", email_body, kind="job_seeker"):
                         st.success("Profile submitted! Our recruiters will review your information and contact you soon.")
                     else:
                         st.error("Failed to submit profile. Please try again or contact us directly.")
@@ -441,6 +1218,11 @@ def recruiting_page():
             submitted = st.form_submit_button("Request Talent")
             if submitted:
                 if company and contact_name and email:
+                    matches = match_candidates(target_roles, hiring_needs, k=max(10, 3 * number_positions))
+                    shortlist = "\n".join(
+                        f"{m.name} <{m.email or 'no email'}> - {m.current_role or 'n/a'}, {m.match}% match"
+                        for m in matches.itertuples()
+                    ) or "No matching candidates yet"
                     email_body = f"""
                     New hiring request from {company}.
                     
@@ -453,10 +1235,18 @@ def recruiting_page():
                     
                     Number of Positions: {number_positions}
                     Target Roles: {', '.join(target_roles)}
+                    
+                    Top Matches:
+                    {shortlist}
                     """
                     
-                    if send_email(EMAIL, f"Hiring Request from {company}", email_body):
+                    if send_email(EMAIL, f"Hiring Request from {company}", email_body, kind="hiring"):
                         st.success("Request submitted! Our recruitment team will contact you within 24 hours.")
+                        if not matches.empty:
+                            st.markdown("**Candidates in our talent pool matching your request:**")
+                            st.dataframe(matches[["current_role", "experience", "match"]].rename(columns={
+                                "current_role": "Current Role", "experience": "Years", "match": "Match %"
+                            }), hide_index=True)
                     else:
                         st.error("Failed to submit request. Please try again or contact us directly.")
                 else:
@@ -516,7 +1306,8 @@ def booking_page():
                 Please confirm this appointment via email or phone.
                 """
                 
-                if send_email(EMAIL, f"Appointment Booking from {name}", email_body):
+                get_leads().record(name, email, "booking", service)
+                if send_email(EMAIL, f"Appointment Booking from {name}", email_body, kind="booking"):
                     st.success("Appointment booked! You'll receive a confirmation shortly.")
                 else:
                     st.error("Failed to book appointment. Please try again or contact us directly.")
@@ -533,7 +1324,7 @@ def payment_page():
     
     program = st.selectbox(
         "Select your training program:",
-        [course for courses in TRAINING_COURSES.values() for course in courses]
+        get_catalog().flat
     )
     
     st.markdown(f"### Pricing for {program.split(':')[0]}")
@@ -546,7 +1337,7 @@ def payment_page():
     
     if payment_option.startswith("Full"):
         st.markdown("**Total:** $3,500 (one-time payment)")
-        payment_link = create_payment_link(3500)
+        amount, installments = 3500, False
     else:
         st.markdown("""
         **Payment Schedule:**
@@ -555,12 +1346,22 @@ def payment_page():
         - Month 3: $1,000
         **Total:** $3,500
         """)
-        payment_link = create_payment_link(1500, installments=True)
+        amount, installments = 1500, True
     
     st.markdown("---")
     
+    col1, col2 = st.columns(2)
+    name = col1.text_input("Full Name")
+    email = col2.text_input("Email")
+    
     if st.button("Proceed to Payment"):
+        if not email.strip():
+            st.warning("Please enter your email so we can match your payment to your enrollment.")
+            return
+        payment_link = create_payment_link(amount, installments=installments, program=program,
+                                           customer={"name": name.strip(), "email": email.strip()})
         webbrowser.open_new_tab(payment_link)
+        get_activity_log().record("Opened payment link", f"{payment_option.split(' (')[0]} for {program.split(':')[0]}")
         st.success("Redirecting to secure payment portal...")
 
 def social_media_page():
@@ -574,15 +1375,13 @@ def social_media_page():
     
     platforms = st.multiselect(
         "Select platforms to post to:",
-        ["Twitter", "Facebook", "LinkedIn", "Instagram", "Reddit"],
+        SOCIAL_PLATFORMS,
         ["Twitter", "Facebook", "LinkedIn"]
     )
     
     if st.button("Post to Selected Platforms"):
         with st.spinner("Posting to social media..."):
-            for platform in platforms:
-                time.sleep(1)  # Simulate API delay
-                st.success(f"Posted to {platform}: {promo_text[:50]}...")
+            post_to_social_media(promo_text, platforms)
     
     st.markdown("---")
     st.subheader("Social Media Performance")
@@ -608,7 +1407,16 @@ def social_media_page():
         platforms = st.multiselect("Platforms", data["Platform"])
         
         if st.form_submit_button("Schedule Post"):
-            st.success(f"Post scheduled for {post_date} at {post_time} on {', '.join(platforms)}")
+            if platforms:
+                get_scheduler().schedule(datetime.datetime.combine(post_date, post_time), post_content, platforms)
+                get_activity_log().record("Scheduled post", f"{post_date} {post_time} on {', '.join(platforms)}")
+                st.success(f"Post scheduled for {post_date} at {post_time} on {', '.join(platforms)}")
+            else:
+                st.warning("Please select at least one platform.")
+    
+    schedule = get_scheduler().stats()
+    if schedule["next_due"]:
+        st.caption(f"{schedule['queued']} posts queued, next at {schedule['next_due']:%Y-%m-%d %H:%M}")
 
 def admin_dashboard():
     st.title(f"{AGENT_NAME} Admin Dashboard")
@@ -619,9 +1427,8 @@ def admin_dashboard():
     
     with col1:
         if st.button("Send Follow-up Emails"):
-            # Simulate sending follow-ups
-            time.sleep(2)
-            st.success("Sent 25 follow-up emails to prospective students")
+            sent = run_follow_ups(get_leads(), get_dispatcher())
+            st.success(f"Queued {sent} follow-up emails to prospective students")
     
     with col2:
         if st.button("Post Daily Promo"):
@@ -629,27 +1436,55 @@ def admin_dashboard():
     
     with col3:
         if st.button("Update Course Listings"):
+            get_activity_log().record("Updated course listings")
             st.success("Course listings updated across all platforms")
     
+    with st.expander("Import Resumes"):
+        with st.form("resume_import", clear_on_submit=True):
+            uploads = st.file_uploader("Resumes (PDF or DOCX)", type=["pdf", "docx"], accept_multiple_files=True)
+            if st.form_submit_button("Import") and uploads:
+                for upload in uploads:
+                    save_candidate(upload, name=os.path.splitext(upload.name)[0])
+                get_activity_log().record("Imported resumes", f"{len(uploads)} queued for skill extraction")
+                st.success(f"Queued {len(uploads)} resumes for skill extraction")
+        counts = get_candidates().status_counts()
+        st.caption(f"Resumes: {counts.get('queued', 0)} queued, {counts.get('extracted', 0)} extracted, "
+                   f"{counts.get('failed', 0)} failed")
+    
     st.markdown("---")
     st.subheader("Recent Activity")
     
-    # Simulated activity log
-    activities = [
-        {"time": "10:30 AM", "action": "Posted to Twitter", "details": "New AWS course promo"},
-        {"time": "9:45 AM", "action": "Sent emails", "details": "15 follow-ups to leads"},
-        {"time": "Yesterday", "action": "Processed payments", "details": "3 new enrollments"},
-        {"time": "Yesterday", "action": "Scheduled posts", "details": "5 posts for next week"}
-    ]
+    activity = get_activity_log()
+    range_choice = st.radio("Show", ["Latest", "Today", "Last 7 days"], horizontal=True)
+    if range_choice == "Latest":
+        activities = activity.recent(20)
+    else:
+        days = 0 if range_choice == "Today" else 6
+        start = datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=days), datetime.time())
+        activities = activity.between(start.timestamp(), time.time())[::-1]
     
-    for activity in activities:
+    if not activities:
+        st.info("No activity yet.")
+    for entry in activities[:200]:
         st.markdown(f"""
-        **{activity['time']}** - *{activity['action']}*  
-        {activity['details']}
+        **{datetime.datetime.fromtimestamp(entry['time']):%b %d %I:%M %p}** - *{entry['action']}*  
+        {entry['details']}
         """)
 
 # Main app logic
+def start_background_services():
+    """Start the shared worker threads on the first run of any page.
+
+    Due scheduled posts, buffered digests and queued resumes left over from
+    before a restart are picked up right away instead of waiting for
+    someone to open the page that uses them.
+    """
+    get_scheduler()
+    get_digest()
+    get_resume_ingestor()
+
 def main():
+    start_background_services()
     st.sidebar.title(f"{AGENT_NAME} Agent")
     st.sidebar.image("https://via.placeholder.com/150?text=SITM", width=100)
     
@@ -676,6 +1511,13 @@ def main():
     {PHONE}  
     """)
     
+    if st.session_state.get('notifications'):
+        st.sidebar.markdown("---")
+        st.sidebar.markdown("### Your Requests")
+        dispatcher = get_dispatcher()
+        for job_id, subject in st.session_state['notifications'][-5:]:
+            st.sidebar.caption(f"{subject}: {dispatcher.status(job_id)}")
+    
     # Display the selected page
     if st.session_state.page == 'home':
         home_page()
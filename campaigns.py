@@ -0,0 +1,702 @@
+"""Bulk email delivery: rate limiting, SMTP pooling, templates, outbox and suppressions.
+
+Campaign shards run in worker processes started with ``spawn`` or
+``forkserver``, so everything they execute lives here rather than in the
+Streamlit script, which those workers cannot import.
+"""
+import hashlib
+import math
+import os
+import queue
+import random
+import smtplib
+import sqlite3
+import string
+import threading
+import time
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import pandas as pd
+
+
+# Sustained messages/second and burst size per SMTP host. Override with
+# SMTP_RATE_LIMIT / SMTP_BURST for hosts not listed here.
+PROVIDER_LIMITS = {
+    "smtp.gmail.com": {"rate": 10.0, "burst": 20},
+    "smtp.office365.com": {"rate": 5.0, "burst": 10},
+    "smtp.sendgrid.net": {"rate": 100.0, "burst": 200},
+    "default": {"rate": 20.0, "burst": 40},
+}
+
+# Transient "try again later" replies that mean we are being throttled
+THROTTLE_CODES = {421, 450, 451, 452}
+
+
+def smtp_error_code(error):
+    """Return the SMTP reply code carried by an smtplib exception, if any"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return codes[0] if codes else None
+    return getattr(error, "smtp_code", None)
+
+
+class AdaptiveRateLimiter:
+    """Token bucket that backs off when the provider starts throttling.
+
+    ``acquire`` blocks until a token is available. Each throttle reply
+    halves the refill rate and schedules an exponential backoff pause for
+    every sender; a run of successes raises the rate back up towards the
+    configured ceiling.
+    """
+
+    def __init__(self, rate, burst, min_rate=0.5, base_backoff=1.0,
+                 max_backoff=120.0, recovery=50):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = burst
+        self.min_rate = min_rate
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.recovery = recovery
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.streak = 0
+        self.strikes = 0
+        self.lock = threading.Lock()
+        self.metrics = {"acquired": 0, "throttled": 0, "waited": 0.0}
+
+    @classmethod
+    def for_host(cls, host):
+        limits = dict(PROVIDER_LIMITS.get(host, PROVIDER_LIMITS["default"]))
+        if os.getenv("SMTP_RATE_LIMIT"):
+            limits["rate"] = float(os.getenv("SMTP_RATE_LIMIT"))
+        if os.getenv("SMTP_BURST"):
+            limits["burst"] = int(os.getenv("SMTP_BURST"))
+        return cls(limits["rate"], limits["burst"])
+
+    def acquire(self):
+        """Block until one message may be sent"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.metrics["acquired"] += 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+                self.metrics["waited"] += wait
+            time.sleep(wait)
+
+    def success(self):
+        with self.lock:
+            self.strikes = 0
+            self.streak += 1
+            if self.streak >= self.recovery and self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate * 1.25)
+                self.streak = 0
+
+    def throttled(self):
+        """Record a 4xx throttle reply and return the backoff in seconds"""
+        with self.lock:
+            self.metrics["throttled"] += 1
+            self.streak = 0
+            now = time.monotonic()
+            if now < self.paused_until:
+                # Other senders already reacted to this throttling episode
+                return self.paused_until - now
+            self.strikes += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** (self.strikes - 1))
+            backoff *= random.uniform(0.5, 1.0)
+            self.paused_until = now + backoff
+            return backoff
+
+    def snapshot(self):
+        """Current limiter metrics"""
+        with self.lock:
+            return dict(self.metrics, rate=self.rate, max_rate=self.max_rate,
+                        burst=self.burst, strikes=self.strikes)
+
+
+def smtp_settings():
+    """Read SMTP settings from the environment"""
+    return {
+        "host": os.getenv("SMTP_SERVER", "smtp.gmail.com"),
+        "port": int(os.getenv("SMTP_PORT", 587)),
+        "username": os.getenv("EMAIL_ADDRESS", "your@email.com"),
+        "password": os.getenv("EMAIL_PASSWORD", "yourpassword"),
+        "starttls": os.getenv("SMTP_STARTTLS", "1") != "0",
+        "pool_size": int(os.getenv("SMTP_POOL_SIZE", 4)),
+    }
+
+
+class SMTPDeliveryEngine:
+    """Deliver messages over a pool of authenticated SMTP connections.
+
+    Each worker thread owns one connection and keeps it open for the whole
+    batch, so the connect/STARTTLS/login cost is paid once per connection
+    instead of once per message. Point it at a local sink (for example
+    ``python -m aiosmtpd -n -l localhost:1025``) with ``starttls=False`` and
+    an empty password to test without a real provider.
+    """
+
+    def __init__(self, host, port, username="", password="", starttls=True,
+                 pool_size=4, timeout=30, max_retries=2, limiter=None,
+                 max_connect_failures=5, connect_backoff=1.0, max_backoff=30.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.pool_size = max(1, pool_size)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.limiter = limiter
+        self.max_connect_failures = max_connect_failures
+        self.connect_backoff = connect_backoff
+        self.max_backoff = max_backoff
+
+    @classmethod
+    def from_env(cls, limiter=None):
+        return cls(limiter=limiter, **smtp_settings())
+
+    def connect(self):
+        """Open one authenticated SMTP connection"""
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        server.ehlo()
+        if self.starttls:
+            server.starttls()
+            server.ehlo()
+        if self.password:
+            server.login(self.username, self.password)
+        return server
+
+    def deliver(self, messages):
+        """Send ``(recipient, message)`` pairs and return delivery stats.
+
+        ``message`` may be an email message object or already-serialized
+        ``bytes``. A connection that drops mid-batch is reopened and the
+        message is retried up to ``max_retries`` times.
+
+        Reconnects back off exponentially, and a worker gives up after
+        ``max_connect_failures`` failed connects in a row. A rejected login
+        stops every worker at once, since each further attempt risks
+        locking the account. Recipients left untried are returned in
+        ``unsent`` and the reason in ``aborted``.
+        """
+        work = queue.Queue()
+        for recipient, msg in messages:
+            work.put((recipient, msg, 0))
+
+        stats = {"sent": 0, "failed": 0, "reconnects": 0, "throttled": 0,
+                 "errors": [], "bounced": [], "unsent": [], "aborted": None}
+        lock = threading.Lock()
+        abort = threading.Event()
+        # Other workers wait for the first login so bad credentials are tried once
+        first_connected = threading.Event()
+        workers = min(self.pool_size, work.qsize()) or 1
+
+        def fail(recipient, error, code=None):
+            with lock:
+                stats["failed"] += 1
+                stats["errors"].append((recipient, str(error)))
+                if isinstance(error, smtplib.SMTPRecipientsRefused) and 550 <= (code or 0) < 560:
+                    stats["bounced"].append(recipient)
+
+        def worker(first):
+            server = None
+            connect_failures = 0
+            if not first:
+                first_connected.wait()
+            try:
+                while not abort.is_set():
+                    try:
+                        recipient, msg, attempt = work.get_nowait()
+                    except queue.Empty:
+                        return
+                    if server is None:
+                        try:
+                            server = self.connect()
+                            connect_failures = 0
+                            first_connected.set()
+                        except smtplib.SMTPAuthenticationError as e:
+                            work.put((recipient, msg, attempt))
+                            with lock:
+                                stats["aborted"] = f"SMTP login rejected: {e}"
+                            abort.set()
+                            return
+                        except OSError as e:
+                            work.put((recipient, msg, attempt))
+                            connect_failures += 1
+                            with lock:
+                                stats["reconnects"] += 1
+                            if connect_failures >= self.max_connect_failures:
+                                with lock:
+                                    stats["aborted"] = f"Could not connect to {self.host}: {e}"
+                                return
+                            time.sleep(min(self.max_backoff, self.connect_backoff * 2 ** (connect_failures - 1)))
+                            continue
+                    payload = msg if isinstance(msg, bytes) else msg.as_bytes()
+                    try:
+                        if self.limiter:
+                            self.limiter.acquire()
+                        server.sendmail(self.username, [recipient], payload)
+                        if self.limiter:
+                            self.limiter.success()
+                        with lock:
+                            stats["sent"] += 1
+                    except OSError as e:
+                        # SMTPException subclasses OSError: throttle replies
+                        # back off, a dropped transport reconnects, and any
+                        # other SMTP error fails the recipient outright.
+                        code = smtp_error_code(e)
+                        throttled = code in THROTTLE_CODES
+                        dropped = (isinstance(e, smtplib.SMTPServerDisconnected)
+                                   or not isinstance(e, smtplib.SMTPException)
+                                   or code == 421)
+                        if throttled and self.limiter:
+                            self.limiter.throttled()
+                        if dropped:
+                            server = None
+                        with lock:
+                            stats["throttled"] += throttled
+                            stats["reconnects"] += dropped
+                        if (throttled or dropped) and attempt < self.max_retries:
+                            work.put((recipient, msg, attempt + 1))
+                        else:
+                            fail(recipient, e, code)
+            finally:
+                first_connected.set()
+                if server is not None:
+                    try:
+                        server.quit()
+                    except OSError:
+                        pass
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(i == 0,), daemon=True) for i in range(workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        while not work.empty():
+            stats["unsent"].append(work.get_nowait()[0])
+        stats["elapsed"] = time.perf_counter() - start
+        stats["rate"] = stats["sent"] / stats["elapsed"] if stats["elapsed"] else 0.0
+        if self.limiter:
+            stats["limiter"] = self.limiter.snapshot()
+        return stats
+
+
+PERSONALIZATION_TAGS = ["first_name", "last_name", "location", "current_job"]
+
+
+class CampaignTemplate:
+    """Email body template compiled once and rendered column-wise.
+
+    The ``{tag}`` placeholders are parsed a single time; ``render`` then
+    builds every body in a DataFrame (or chunk of one) with vectorized
+    string concatenation instead of calling ``str.format`` per row.
+    """
+
+    def __init__(self, message):
+        self.parts = []
+        for literal, field, spec, conversion in string.Formatter().parse(message):
+            if literal:
+                self.parts.append(("literal", literal))
+            if field is None:
+                continue
+            if field not in PERSONALIZATION_TAGS:
+                raise KeyError(field)
+            self.parts.append(("field", (field, spec or "", conversion)))
+
+    @property
+    def fields(self):
+        return [value[0] for kind, value in self.parts if kind == "field"]
+
+    def render(self, contacts_df):
+        """Return a Series of personalized bodies aligned with ``contacts_df``"""
+        bodies = pd.Series("", index=contacts_df.index, dtype=object)
+        for kind, value in self.parts:
+            if kind == "literal":
+                bodies = bodies + value
+                continue
+            field, spec, conversion = value
+            if field not in contacts_df.columns:
+                # Missing columns render as empty once for the whole batch
+                column = format("", spec) if spec else ""
+            else:
+                column = contacts_df[field].fillna("")
+                if conversion == "r":
+                    column = column.map(repr)
+                if spec:
+                    column = column.map(lambda v: format(v, spec))
+                column = column.astype(str)
+            bodies = bodies + column
+        return bodies
+
+    def render_chunks(self, contacts_df, chunk_size=10000):
+        """Yield ``(chunk, bodies)`` pairs of at most ``chunk_size`` rows"""
+        for start in range(0, len(contacts_df), chunk_size):
+            chunk = contacts_df.iloc[start:start + chunk_size]
+            yield chunk, self.render(chunk)
+
+
+OUTBOX_STATES = ["queued", "sent", "failed"]
+
+
+class CampaignOutbox:
+    """SQLite-backed record of every recipient's delivery state.
+
+    Recipients are keyed by ``(campaign_id, email)`` so re-enqueueing after
+    a crash or rerun never duplicates a send. Per-state counters are kept in
+    their own table and updated in the same transaction as each batch, so
+    ``status`` stays a handful of row reads regardless of campaign size.
+
+    A campaign is one run of a subject and message, named by ``run``.
+    Reopening the same run resumes it; a new run name sends the same
+    content to the audience again.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS campaigns (
+                id TEXT PRIMARY KEY,
+                subject TEXT,
+                message TEXT,
+                created TEXT,
+                run TEXT NOT NULL DEFAULT ''
+            );
+            CREATE TABLE IF NOT EXISTS outbox (
+                campaign_id TEXT NOT NULL,
+                email TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'queued',
+                error TEXT,
+                updated TEXT,
+                PRIMARY KEY (campaign_id, email)
+            );
+            CREATE INDEX IF NOT EXISTS outbox_state ON outbox (campaign_id, state);
+            CREATE TABLE IF NOT EXISTS outbox_counts (
+                campaign_id TEXT NOT NULL,
+                state TEXT NOT NULL,
+                n INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (campaign_id, state)
+            );
+        """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(campaigns)")]
+        if "run" not in columns:
+            self.conn.execute("ALTER TABLE campaigns ADD COLUMN run TEXT NOT NULL DEFAULT ''")
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv("OUTBOX_PATH", "sitm_outbox.db"))
+
+    def open_campaign(self, subject, message, run=""):
+        """Return the id for this run of subject/message, creating it if needed"""
+        key = f"{subject}\0{message}" + (f"\0{run}" if run else "")
+        campaign_id = hashlib.sha1(key.encode()).hexdigest()[:16]
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO campaigns (id, subject, message, created, run) VALUES (?, ?, ?, ?, ?)",
+                (campaign_id, subject, message, datetime.now().isoformat(), run)
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO outbox_counts VALUES (?, ?, 0)",
+                [(campaign_id, state) for state in OUTBOX_STATES]
+            )
+        return campaign_id
+
+    def _bump(self, campaign_id, state, delta):
+        self.conn.execute(
+            "UPDATE outbox_counts SET n = n + ? WHERE campaign_id = ? AND state = ?",
+            (delta, campaign_id, state)
+        )
+
+    def enqueue(self, campaign_id, emails, batch_size=5000):
+        """Queue recipients, skipping any the campaign already knows about"""
+        added = 0
+        batch = []
+        for email in emails:
+            batch.append((campaign_id, email))
+            if len(batch) >= batch_size:
+                added += self._enqueue_batch(campaign_id, batch)
+                batch = []
+        if batch:
+            added += self._enqueue_batch(campaign_id, batch)
+        return added
+
+    def _enqueue_batch(self, campaign_id, batch):
+        with self.conn:
+            cur = self.conn.executemany(
+                "INSERT OR IGNORE INTO outbox (campaign_id, email) VALUES (?, ?)", batch
+            )
+            self._bump(campaign_id, "queued", cur.rowcount)
+        return cur.rowcount
+
+    def queued_among(self, campaign_id, emails, batch_size=500):
+        """Return the subset of ``emails`` still queued for the campaign"""
+        emails = list(emails)
+        queued = set()
+        for start in range(0, len(emails), batch_size):
+            batch = emails[start:start + batch_size]
+            marks = ",".join("?" * len(batch))
+            queued.update(email for (email,) in self.conn.execute(
+                f"SELECT email FROM outbox WHERE campaign_id = ? AND state = 'queued' "
+                f"AND email IN ({marks})",
+                [campaign_id, *batch]
+            ))
+        return queued
+
+    def checkpoint(self, campaign_id, sent, failed):
+        """Record a batch of results in one transaction.
+
+        ``sent`` is a list of emails, ``failed`` a list of ``(email, error)``.
+        """
+        now = datetime.now().isoformat()
+        with self.conn:
+            done = self.conn.executemany(
+                "UPDATE outbox SET state = 'sent', updated = ? "
+                "WHERE campaign_id = ? AND email = ? AND state = 'queued'",
+                [(now, campaign_id, email) for email in sent]
+            ).rowcount
+            failed_n = self.conn.executemany(
+                "UPDATE outbox SET state = 'failed', error = ?, updated = ? "
+                "WHERE campaign_id = ? AND email = ? AND state = 'queued'",
+                [(error, now, campaign_id, email) for email, error in failed]
+            ).rowcount
+            self._bump(campaign_id, "sent", done)
+            self._bump(campaign_id, "failed", failed_n)
+            self._bump(campaign_id, "queued", -(done + failed_n))
+
+    def requeue_failed(self, campaign_id):
+        """Move failed recipients back to the queue for another attempt"""
+        with self.conn:
+            n = self.conn.execute(
+                "UPDATE outbox SET state = 'queued', error = NULL "
+                "WHERE campaign_id = ? AND state = 'failed'",
+                (campaign_id,)
+            ).rowcount
+            self._bump(campaign_id, "failed", -n)
+            self._bump(campaign_id, "queued", n)
+        return n
+
+    def unfinished_run(self, subject, message):
+        """Name of the latest run of subject/message with recipients still queued, or None"""
+        row = self.conn.execute(
+            "SELECT campaigns.run FROM campaigns JOIN outbox_counts "
+            "ON outbox_counts.campaign_id = campaigns.id AND outbox_counts.state = 'queued' "
+            "WHERE subject = ? AND message = ? AND outbox_counts.n > 0 "
+            "ORDER BY campaigns.created DESC LIMIT 1",
+            (subject, message)
+        ).fetchone()
+        return row[0] if row else None
+
+    def status(self, campaign_id):
+        """Return ``{state: count}`` for a campaign"""
+        rows = self.conn.execute(
+            "SELECT state, n FROM outbox_counts WHERE campaign_id = ?", (campaign_id,)
+        ).fetchall()
+        return {state: 0 for state in OUTBOX_STATES} | dict(rows)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings using double hashing"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(1, capacity)
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class SuppressionList:
+    """Bounced and unsubscribed addresses that must never be mailed.
+
+    Lookups hit an in-memory Bloom filter first; only the rare "maybe"
+    answers are confirmed against the exact SQLite table. New entries are
+    added to both, and the filter is rebuilt at twice the size once it
+    fills past its capacity.
+    """
+
+    def __init__(self, path, capacity=100000):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS suppressions (
+                email TEXT PRIMARY KEY,
+                reason TEXT,
+                added TEXT
+            )
+        """)
+        self.rebuild(capacity)
+
+    def rebuild(self, capacity=None):
+        """Reload the filter from the exact table"""
+        with self.lock:
+            total = self.conn.execute("SELECT COUNT(*) FROM suppressions").fetchone()[0]
+            bloom = BloomFilter(max(capacity or 0, total * 2))
+            for (email,) in self.conn.execute("SELECT email FROM suppressions"):
+                bloom.add(email)
+            self.bloom = bloom
+
+    def add(self, emails, reason):
+        """Suppress addresses, returning how many were new"""
+        rows = [(email.strip().lower(), reason, datetime.now().isoformat()) for email in emails]
+        with self.lock:
+            with self.conn:
+                before = self.conn.total_changes
+                self.conn.executemany("INSERT OR IGNORE INTO suppressions VALUES (?, ?, ?)", rows)
+                added = self.conn.total_changes - before
+            for email, _, _ in rows:
+                self.bloom.add(email)
+            full = self.bloom.count > self.bloom.capacity
+        if full:
+            self.rebuild()
+        return added
+
+    def __contains__(self, email):
+        if email not in self.bloom:
+            return False
+        with self.lock:
+            return self.conn.execute(
+                "SELECT 1 FROM suppressions WHERE email = ?", (email,)
+            ).fetchone() is not None
+
+    def mask(self, emails):
+        """Boolean Series marking which normalized ``emails`` are suppressed"""
+        return emails.map(self.__contains__).astype(bool)
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM suppressions").fetchone()[0]
+
+
+def normalize_emails(emails):
+    """Trim and lowercase a Series of addresses"""
+    return emails.astype(str).str.strip().str.lower()
+
+
+def run_campaign(subject, message, chunks, engine, outbox, suppressions,
+                 batch_size=1000, on_batch=None, run=""):
+    """Deliver a stream of contact chunks and return the campaign totals.
+
+    Each batch is checked against the outbox and suppression list, rendered,
+    delivered and checkpointed under the campaign ``run``. ``on_batch``
+    receives the per-batch counts.
+    """
+    email_address = engine.username
+    template = CampaignTemplate(message)
+    campaign_id = outbox.open_campaign(subject, message, run)
+
+    totals = {"processed": 0, "sent": 0, "failed": 0, "reconnects": 0,
+              "throttled": 0, "suppressed": 0, "elapsed": 0.0}
+    for chunk in chunks:
+        for start in range(0, len(chunk), batch_size):
+            batch = chunk.iloc[start:start + batch_size]
+            counts = dict.fromkeys(totals, 0)
+            counts["processed"] = len(batch)
+            outbox.enqueue(campaign_id, batch['email'])
+            # Recipients already sent by an earlier run are skipped
+            queued = outbox.queued_among(campaign_id, batch['email'])
+            batch = batch[batch['email'].isin(queued)].drop_duplicates('email')
+            suppressed = suppressions.mask(normalize_emails(batch['email']))
+            if suppressed.any():
+                outbox.checkpoint(campaign_id, [], [(email, "suppressed") for email in batch['email'][suppressed]])
+                counts["suppressed"] = int(suppressed.sum())
+                batch = batch[~suppressed]
+
+            if not batch.empty:
+                bodies = template.render(batch)
+                messages = []
+                for recipient, personalized_msg in zip(batch['email'], bodies):
+                    msg = MIMEMultipart()
+                    msg['From'] = email_address
+                    msg['To'] = recipient
+                    msg['Subject'] = subject
+                    msg.attach(MIMEText(personalized_msg, 'plain'))
+                    messages.append((recipient, msg))
+
+                stats = engine.deliver(messages)
+                failed = dict(stats["errors"])
+                unsent = set(stats["unsent"])
+                outbox.checkpoint(
+                    campaign_id,
+                    [recipient for recipient, _ in messages if recipient not in failed and recipient not in unsent],
+                    list(failed.items())
+                )
+                if stats["bounced"]:
+                    suppressions.add(stats["bounced"], "bounce")
+                for key in ("sent", "failed", "reconnects", "throttled", "elapsed"):
+                    counts[key] = stats[key]
+                if stats["aborted"]:
+                    # Unsent recipients stay queued for the next run
+                    raise RuntimeError(stats["aborted"])
+
+            for key in totals:
+                totals[key] += counts[key]
+            if on_batch:
+                on_batch(counts)
+    return totals
+
+
+def run_campaign_shard(shard, shards, subject, message, run, inbox, progress):
+    """Process entry point: deliver every chunk put on ``inbox``.
+
+    The shard opens its own SMTP connections, SQLite handles and rate
+    limiter (at ``1/shards`` of the provider limit); it runs in a fresh
+    interpreter and shares nothing with the Streamlit process. After each
+    batch it reports the counts and a snapshot of its limiter. If the shard
+    fails it keeps draining ``inbox`` up to the sentinel so the feeder is
+    never left blocked on a full queue.
+    """
+    finished = False
+    try:
+        settings = smtp_settings()
+        limiter = AdaptiveRateLimiter.for_host(settings["host"])
+        limiter.max_rate = limiter.rate = limiter.rate / shards
+        limiter.burst = max(1, limiter.burst // shards)
+        engine = SMTPDeliveryEngine(limiter=limiter, **settings)
+        outbox = CampaignOutbox.from_env()
+        suppressions = SuppressionList(os.getenv("OUTBOX_PATH", "sitm_outbox.db"))
+
+        def chunks():
+            nonlocal finished
+            while (chunk := inbox.get()) is not None:
+                yield chunk
+            finished = True
+
+        def report(counts):
+            progress.put(("batch", shard, counts))
+            progress.put(("limiter", shard, limiter.snapshot()))
+
+        run_campaign(subject, message, chunks(), engine, outbox, suppressions, on_batch=report, run=run)
+        progress.put(("done", shard, None))
+    except Exception as e:
+        progress.put(("error", shard, str(e)))
+        while not finished:
+            finished = inbox.get() is None
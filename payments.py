@@ -0,0 +1,336 @@
+"""Payment link client shared by the SITM apps"""
+import csv
+import hashlib
+import json
+import logging
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+class PaymentClient:
+    """Create checkout links over a pooled keep-alive HTTP session.
+
+    Every link is tied to an idempotency key derived from the customer,
+    course, plan and amount. The key is sent to the provider as the
+    ``Idempotency-Key`` header and also indexes a local cache, so repeated
+    submits and reruns return the link already issued without another
+    round trip.
+
+    The provider is expected to accept ``POST {base_url}/payment_links``
+    with a JSON body and answer with ``{"id": ..., "url": ...}``.
+    """
+
+    def __init__(self, base_url, api_key, pool_size=10, timeout=10, ledger=None):
+        self.ledger = ledger
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {api_key}"
+        # POST is safe to retry because every request carries an idempotency key
+        retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                        allowed_methods=None)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.links = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def idempotency_key(customer, course, plan, amount):
+        """Stable key for one customer paying one amount for a course on one plan"""
+        email = (customer or {}).get("email", "").strip().lower()
+        cents = int(round(amount * 100))
+        return hashlib.sha256(f"{email}|{course}|{plan}|{cents}".encode()).hexdigest()
+
+    def create_link(self, amount, description, customer=None, course="", plan=""):
+        """Return the checkout URL, creating it at the provider only once"""
+        key = self.idempotency_key(customer, course, plan, amount)
+        with self.lock:
+            if key in self.links:
+                return self.links[key]["url"]
+        if self.ledger:
+            issued = self.ledger.find_link(key)
+            if issued:
+                with self.lock:
+                    self.links[key] = issued
+                return issued["url"]
+
+        response = self.session.post(
+            f"{self.base_url}/payment_links",
+            json={
+                "amount": int(round(amount * 100)),
+                "currency": "usd",
+                "description": description,
+                "customer": customer or {},
+                "metadata": {"course": course, "plan": plan, "idempotency_key": key},
+            },
+            headers={"Idempotency-Key": key},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        link = response.json()
+        with self.lock:
+            self.links[key] = {
+                "id": link.get("id", ""),
+                "url": link["url"],
+                "email": (customer or {}).get("email", ""),
+                "course": course,
+                "plan": plan,
+                "amount": amount,
+            }
+        if self.ledger:
+            self.ledger.record_link(key, self.links[key])
+        return link["url"]
+
+    def create_links(self, orders, workers=None):
+        """Create links for a cohort.
+
+        ``orders`` is a list of ``create_link`` keyword dicts. Requests share
+        the connection pool and run concurrently; URLs come back in order.
+        """
+        with ThreadPoolExecutor(max_workers=workers or self.pool_size) as pool:
+            return list(pool.map(lambda order: self.create_link(**order), orders))
+
+
+def amount_cents(amount, units="cents"):
+    """Integer cents from an event amount.
+
+    ``units`` says how the source writes amounts: ``"cents"`` for webhook
+    payloads, ``"currency"`` for exports such as ``"12.50"`` or ``"3500"``.
+    Returns None when the amount cannot be read or is not a whole number
+    of cents.
+    """
+    if amount in (None, ""):
+        return 0
+    try:
+        value = Decimal(str(amount).strip())
+        if units == "currency":
+            value *= 100
+        if value != value.to_integral_value():
+            return None
+        return int(value)
+    except (ArithmeticError, ValueError):
+        return None
+
+
+# Provider event types mapped to the status they put a link in
+EVENT_STATUSES = {
+    "payment.succeeded": "paid",
+    "checkout.session.completed": "paid",
+    "charge.refunded": "refunded",
+    "payment.refunded": "refunded",
+}
+
+
+class PaymentLedger:
+    """SQLite record of issued links, payment events and enrollments.
+
+    ``reconcile`` loads a batch of provider events into a temporary table
+    and applies it with a few set-based statements in one transaction:
+    events already seen are skipped, matching links are found through the
+    ``link_id`` index, and the enrollments for every paid or refunded link
+    are updated together.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS payment_links (
+                key TEXT PRIMARY KEY,
+                link_id TEXT,
+                url TEXT,
+                email TEXT,
+                course TEXT,
+                plan TEXT,
+                amount REAL,
+                status TEXT NOT NULL DEFAULT 'issued',
+                paid_cents INTEGER NOT NULL DEFAULT 0,
+                created TEXT
+            );
+            CREATE INDEX IF NOT EXISTS payment_links_link_id ON payment_links (link_id);
+            CREATE TABLE IF NOT EXISTS payment_events (
+                id TEXT PRIMARY KEY,
+                link_id TEXT,
+                status TEXT,
+                amount_cents INTEGER,
+                received TEXT
+            );
+            CREATE TABLE IF NOT EXISTS enrollments (
+                email TEXT NOT NULL,
+                course TEXT NOT NULL,
+                status TEXT NOT NULL,
+                updated TEXT,
+                PRIMARY KEY (email, course)
+            );
+            CREATE TEMP TABLE incoming (
+                id TEXT PRIMARY KEY,
+                link_id TEXT,
+                status TEXT,
+                amount_cents INTEGER
+            );
+            CREATE INDEX temp.incoming_link_id ON incoming (link_id);
+        """)
+
+    def record_link(self, key, link):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO payment_links "
+                "(key, link_id, url, email, course, plan, amount, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, link["id"], link["url"], link["email"].strip().lower(), link["course"],
+                 link["plan"], link["amount"], datetime.now().isoformat())
+            )
+
+    def find_link(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT link_id, url, email, course, plan, amount FROM payment_links WHERE key = ?",
+                (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(["id", "url", "email", "course", "plan", "amount"], row))
+
+    def reconcile(self, events, batch_size=10000, units="cents"):
+        """Apply provider events in batches and return reconciliation counts.
+
+        Each event is a dict with ``id``, ``type``, ``link_id`` and
+        ``amount``, given in ``units`` (see ``amount_cents``). Unknown event
+        types are ignored; events without an id or with an unreadable amount
+        are counted as ``invalid`` and skipped.
+        """
+        stats = {"events": 0, "duplicates": 0, "matched": 0, "unmatched": 0, "ignored": 0, "invalid": 0}
+        batch = []
+        for event in events:
+            stats["events"] += 1
+            status = EVENT_STATUSES.get(event.get("type"))
+            if status is None:
+                stats["ignored"] += 1
+                continue
+            cents = amount_cents(event.get("amount"), units)
+            if not event.get("id") or cents is None:
+                stats["invalid"] += 1
+                continue
+            batch.append((str(event["id"]), event.get("link_id"), status, cents))
+            if len(batch) >= batch_size:
+                self._apply(batch, stats)
+                batch = []
+        if batch:
+            self._apply(batch, stats)
+        return stats
+
+    def _apply(self, batch, stats):
+        now = datetime.now().isoformat()
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO incoming VALUES (?, ?, ?, ?)", batch)
+            self.conn.execute(
+                "DELETE FROM incoming WHERE EXISTS "
+                "(SELECT 1 FROM payment_events WHERE payment_events.id = incoming.id)"
+            )
+            fresh = self.conn.execute("SELECT COUNT(*) FROM incoming").fetchone()[0]
+            matched = self.conn.execute(
+                "SELECT COUNT(*) FROM incoming WHERE EXISTS "
+                "(SELECT 1 FROM payment_links WHERE payment_links.link_id = incoming.link_id)"
+            ).fetchone()[0]
+            self.conn.execute(
+                "INSERT INTO payment_events SELECT id, link_id, status, amount_cents, ? FROM incoming",
+                (now,)
+            )
+            # A refund in the batch wins over a payment for the same link
+            self.conn.execute("""
+                UPDATE payment_links SET
+                    paid_cents = paid_cents + totals.cents,
+                    status = CASE WHEN totals.refunded THEN 'refunded' ELSE 'paid' END
+                FROM (
+                    SELECT link_id,
+                           SUM(CASE status WHEN 'paid' THEN amount_cents ELSE -amount_cents END) AS cents,
+                           MAX(status = 'refunded') AS refunded
+                    FROM incoming GROUP BY link_id
+                ) AS totals
+                WHERE payment_links.link_id = totals.link_id
+            """)
+            self.conn.execute("""
+                INSERT INTO enrollments (email, course, status, updated)
+                SELECT email, course, CASE status WHEN 'paid' THEN 'enrolled' ELSE 'refunded' END, ?
+                FROM payment_links WHERE link_id IN (SELECT link_id FROM incoming)
+                ON CONFLICT (email, course) DO UPDATE SET status = excluded.status, updated = excluded.updated
+            """, (now,))
+            self.conn.execute("DELETE FROM incoming")
+        stats["duplicates"] += len(batch) - fresh
+        stats["matched"] += matched
+        stats["unmatched"] += fresh - matched
+
+    def enrollment_counts(self):
+        with self.lock:
+            return dict(self.conn.execute(
+                "SELECT status, COUNT(*) FROM enrollments GROUP BY status"
+            ).fetchall())
+
+
+def iter_payment_events(path):
+    """Stream events from a provider export (CSV or JSON lines).
+
+    Export amounts are in currency units; reconcile them with
+    ``units="currency"``.
+    """
+    with open(path, newline="") as f:
+        if path.lower().endswith((".jsonl", ".json")):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def serve_payment_webhook(ledger, host="127.0.0.1", port=8765, batch_size=1000, flush_seconds=1.0):
+    """Accept provider events on a local webhook and reconcile them in batches.
+
+    POST a JSON event or list of events to any path. Events are queued and a
+    background thread applies them whenever ``batch_size`` have arrived or
+    ``flush_seconds`` have passed. Returns the running server; call
+    ``shutdown()`` to stop it.
+    """
+    events = queue.Queue()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"[]")
+            for event in body if isinstance(body, list) else [body]:
+                events.put(event)
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    def drain():
+        while True:
+            batch = [events.get()]
+            try:
+                while len(batch) < batch_size:
+                    batch.append(events.get(timeout=flush_seconds))
+            except queue.Empty:
+                pass
+            try:
+                ledger.reconcile(batch, batch_size)
+            except Exception:
+                logger.exception("Failed to reconcile %d payment events", len(batch))
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=drain, daemon=True).start()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,357 @@
+"""Resume spooling, text extraction, candidate storage and matching for the SITM apps"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sqlite3
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Canonical skill name -> spellings that count as that skill
+SKILL_KEYWORDS = {
+    "AWS": ["aws", "amazon web services", "ec2", "s3", "cloudformation"],
+    "Azure": ["azure"],
+    "GCP": ["gcp", "google cloud"],
+    "Linux": ["linux", "rhel", "red hat", "ubuntu", "centos"],
+    "Unix": ["unix", "solaris", "aix"],
+    "Windows Server": ["windows server", "active directory"],
+    "Oracle": ["oracle", "pl/sql", "rac", "data guard"],
+    "SQL Server": ["sql server", "mssql", "t-sql"],
+    "PostgreSQL": ["postgresql", "postgres"],
+    "MySQL": ["mysql", "mariadb"],
+    "MongoDB": ["mongodb"],
+    "SQL": ["sql"],
+    "Docker": ["docker"],
+    "Kubernetes": ["kubernetes", "k8s", "eks", "aks", "openshift"],
+    "Terraform": ["terraform"],
+    "Ansible": ["ansible"],
+    "Jenkins": ["jenkins"],
+    "CI/CD": ["ci/cd", "github actions", "gitlab ci"],
+    "Git": ["git", "github", "gitlab"],
+    "Python": ["python"],
+    "Bash": ["bash", "shell scripting"],
+    "PowerShell": ["powershell"],
+    "Java": ["java"],
+    "Networking": ["tcp/ip", "dns", "vpc", "networking"],
+    "Monitoring": ["prometheus", "grafana", "nagios", "datadog", "splunk"],
+}
+
+_SPELLINGS = {spelling: skill for skill, spellings in SKILL_KEYWORDS.items() for spelling in spellings}
+# Longest spellings first so "sql server" wins over "sql" and "pl/sql" over "sql";
+# slashes separate skills ("Java/Python") so they are not word characters here
+_SKILL_PATTERN = re.compile(
+    r"(?<!\w)(" + "|".join(re.escape(s) for s in sorted(_SPELLINGS, key=len, reverse=True)) + r")(?!\w)",
+    re.IGNORECASE,
+)
+
+_WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def spool_upload(upload, directory, chunk_size=1 << 20):
+    """Copy an uploaded file to disk in chunks and return its path.
+
+    Files are named by a hash of their content, so the same resume uploaded
+    twice is stored once.
+    """
+    os.makedirs(directory, exist_ok=True)
+    extension = os.path.splitext(getattr(upload, "name", ""))[1].lower()
+    digest = hashlib.sha256()
+    partial = os.path.join(directory, f".upload-{threading.get_ident()}-{time.monotonic_ns()}")
+    upload.seek(0)
+    with open(partial, "wb") as f:
+        for chunk in iter(lambda: upload.read(chunk_size), b""):
+            digest.update(chunk)
+            f.write(chunk)
+    path = os.path.join(directory, digest.hexdigest() + extension)
+    os.replace(partial, path)
+    return path
+
+
+def extract_text(path):
+    """Plain text of a PDF, DOCX or text resume"""
+    if path.lower().endswith(".pdf"):
+        from pypdf import PdfReader
+
+        return "\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+    if path.lower().endswith(".docx"):
+        parts = []
+        with zipfile.ZipFile(path) as docx, docx.open("word/document.xml") as xml:
+            for _, element in ElementTree.iterparse(xml):
+                if element.tag == _WORD_NS + "t":
+                    parts.append(element.text or "")
+                elif element.tag == _WORD_NS + "p":
+                    parts.append("\n")
+                    element.clear()
+        return "".join(parts)
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+
+def extract_skills(text):
+    """Canonical skills mentioned in ``text``, sorted"""
+    return sorted({_SPELLINGS[match.lower()] for match in _SKILL_PATTERN.findall(text)})
+
+
+def extract_resume(path):
+    """Worker entry point: skills found in one resume file"""
+    return extract_skills(extract_text(path))
+
+
+class CandidateStore:
+    """SQLite record of job seekers and the skills found in their resumes.
+
+    ``skills`` holds what the candidate typed; ``resume_skills`` is filled
+    in once their resume has been extracted. ``resume_status`` is
+    ``none``, ``queued``, ``extracted`` or ``failed: <reason>``.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS candidates (
+                id INTEGER PRIMARY KEY,
+                name TEXT,
+                email TEXT UNIQUE,
+                phone TEXT,
+                current_role TEXT,
+                experience INTEGER,
+                skills TEXT,
+                target_roles TEXT,
+                resume_path TEXT,
+                resume_status TEXT NOT NULL DEFAULT 'none',
+                resume_skills TEXT,
+                submitted REAL
+            );
+            CREATE INDEX IF NOT EXISTS candidates_resume_status ON candidates (resume_status);
+        """)
+
+    def save(self, name, email=None, phone="", current_role="", experience=0, skills="",
+             target_roles=(), resume_path=None):
+        """Add a candidate, or update the one with this email, and return its id"""
+        status = "queued" if resume_path else "none"
+        email = email.strip().lower() if email else None
+        with self.lock, self.conn:
+            return self.conn.execute(
+                "INSERT INTO candidates (name, email, phone, current_role, experience, skills, "
+                "target_roles, resume_path, resume_status, submitted) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (email) DO UPDATE SET name = excluded.name, phone = excluded.phone, "
+                "current_role = excluded.current_role, experience = excluded.experience, "
+                "skills = excluded.skills, target_roles = excluded.target_roles, "
+                "resume_path = COALESCE(excluded.resume_path, resume_path), "
+                "resume_status = CASE WHEN excluded.resume_path IS NULL THEN resume_status ELSE 'queued' END, "
+                "submitted = excluded.submitted RETURNING id",
+                (name, email, phone, current_role, experience, skills, json.dumps(list(target_roles)),
+                 resume_path, status, time.time())
+            ).fetchone()[0]
+
+    def queued_resumes(self):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT id, resume_path FROM candidates WHERE resume_status = 'queued'"
+            ).fetchall()
+
+    def record_extraction(self, results):
+        """Store ``(candidate_id, skills or None, error or None)`` results in one transaction"""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE candidates SET resume_status = ?, resume_skills = ? WHERE id = ?",
+                [("failed: " + error if error else "extracted", None if error else json.dumps(skills), candidate_id)
+                 for candidate_id, skills, error in results]
+            )
+
+    def profiles(self, ids=None):
+        """Yield ``(candidate_id, features)`` for matching.
+
+        Features are the canonical skills found in the typed skills and the
+        resume, plus ``role:<title>`` for each target role.
+        """
+        query = "SELECT id, skills, target_roles, resume_skills FROM candidates"
+        with self.lock:
+            if ids is None:
+                rows = self.conn.execute(query).fetchall()
+            else:
+                rows = self.conn.execute(f"{query} WHERE id IN ({','.join('?' * len(ids))})", list(ids)).fetchall()
+        for candidate_id, skills, target_roles, resume_skills in rows:
+            features = set(extract_skills(skills or ""))
+            features.update(json.loads(resume_skills or "[]"))
+            features.update("role:" + role for role in json.loads(target_roles or "[]"))
+            yield candidate_id, features
+
+    def summaries(self, ids):
+        """``{candidate_id: {id, name, email, current_role, experience}}`` for display"""
+        columns = ["id", "name", "email", "current_role", "experience"]
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(columns)} FROM candidates WHERE id IN ({','.join('?' * len(ids))})", list(ids)
+            ).fetchall()
+        return {row[0]: dict(zip(columns, row)) for row in rows}
+
+    def status_counts(self):
+        with self.lock:
+            return dict(self.conn.execute(
+                "SELECT CASE WHEN resume_status LIKE 'failed%' THEN 'failed' ELSE resume_status END, COUNT(*) "
+                "FROM candidates GROUP BY 1"
+            ).fetchall())
+
+
+class ResumeIngestor:
+    """Extract skills from spooled resumes in a process pool.
+
+    ``submit`` returns immediately; results are written back to the
+    candidate store as workers finish, batched by a flusher thread, and the
+    ids of newly extracted candidates are passed to ``on_extracted``.
+    Resumes still queued from an earlier run are resubmitted on start.
+
+    Workers start with ``forkserver`` where available, otherwise ``spawn``,
+    so the multi-threaded Streamlit server is never forked.
+    """
+
+    def __init__(self, store, workers=None, flush_seconds=0.5, on_extracted=None):
+        self.store = store
+        self.on_extracted = on_extracted
+        self.flush_seconds = flush_seconds
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self.pool = ProcessPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1),
+                                        mp_context=multiprocessing.get_context(method))
+        self.results = []
+        self.lock = threading.Condition()
+        threading.Thread(target=self._flush, daemon=True).start()
+        for candidate_id, path in store.queued_resumes():
+            self.submit(candidate_id, path)
+
+    def submit(self, candidate_id, path):
+        future = self.pool.submit(extract_resume, path)
+        future.add_done_callback(lambda done: self._collect(candidate_id, done))
+
+    def _collect(self, candidate_id, future):
+        error = future.exception()
+        with self.lock:
+            self.results.append((candidate_id, None if error else future.result(),
+                                 f"{type(error).__name__}: {error}" if error else None))
+            self.lock.notify()
+
+    def _flush(self):
+        while True:
+            with self.lock:
+                while not self.results:
+                    self.lock.wait()
+            # Let results from other workers accumulate into one transaction
+            time.sleep(self.flush_seconds)
+            with self.lock:
+                results, self.results = self.results, []
+            try:
+                self.store.record_extraction(results)
+            except Exception:
+                logger.exception("Failed to store %d resume extractions; retrying", len(results))
+                with self.lock:
+                    self.results[:0] = results
+                continue
+            if self.on_extracted:
+                try:
+                    self.on_extracted([candidate_id for candidate_id, _, error in results if not error])
+                except Exception:
+                    logger.exception("Resume extraction callback failed")
+
+
+class CandidateMatcher:
+    """Score every candidate against a request with one sparse product.
+
+    Candidates are rows of a sparse matrix over a fixed feature vocabulary,
+    held as CSR arrays (``indptr``, ``indices`` and L2-normalised
+    ``weights``). A request is a dense vector over the same vocabulary, so
+    the cosine score of every row is a single ``bincount`` over the stored
+    entries and the top k come from ``argpartition``.
+
+    ``add`` only appends to a pending list; pending rows are merged into
+    the arrays on the next ``top``. Adding a candidate again retires its
+    old row, and retired rows are dropped once they are half the matrix.
+    """
+
+    def __init__(self, features):
+        self.features = {feature: column for column, feature in enumerate(features)}
+        self.lock = threading.Lock()
+        self.ids = np.empty(0, np.int64)
+        self.indptr = np.zeros(1, np.int64)
+        self.indices = np.empty(0, np.int32)
+        self.weights = np.empty(0, np.float32)
+        # Row of each stored entry, for bincount
+        self.entry_rows = np.empty(0, np.int64)
+        self.live = np.empty(0, bool)
+        self.rows = {}
+        self.retired = 0
+        self.pending = []
+
+    def __len__(self):
+        with self.lock:
+            if self.pending:
+                self._merge()
+            return len(self.rows)
+
+    def add(self, candidate_id, features):
+        """Add or replace a candidate's features"""
+        columns = sorted({self.features[feature] for feature in features if feature in self.features})
+        with self.lock:
+            self.pending.append((candidate_id, columns))
+
+    def _merge(self):
+        pending, self.pending = self.pending, []
+        first = len(self.ids)
+        lengths = np.fromiter((len(columns) for _, columns in pending), np.int64, len(pending))
+        self.ids = np.concatenate([self.ids, np.fromiter((i for i, _ in pending), np.int64, len(pending))])
+        self.indptr = np.concatenate([self.indptr, self.indptr[-1] + np.cumsum(lengths)])
+        self.indices = np.concatenate([self.indices] + [np.asarray(c, np.int32) for _, c in pending])
+        self.weights = np.concatenate([self.weights, np.repeat(
+            (1 / np.sqrt(np.maximum(lengths, 1))).astype(np.float32), lengths)])
+        self.entry_rows = np.concatenate([self.entry_rows, np.repeat(np.arange(first, len(self.ids)), lengths)])
+        self.live = np.concatenate([self.live, np.ones(len(pending), bool)])
+        for row, (candidate_id, _) in enumerate(pending, first):
+            if candidate_id in self.rows:
+                self.live[self.rows[candidate_id]] = False
+                self.retired += 1
+            self.rows[candidate_id] = row
+        if self.retired * 2 > len(self.ids):
+            self._compact()
+
+    def _compact(self):
+        keep = self.live
+        entries = keep[self.entry_rows]
+        lengths = np.diff(self.indptr)[keep]
+        self.ids = self.ids[keep]
+        self.indptr = np.concatenate([[0], np.cumsum(lengths)])
+        self.indices = self.indices[entries]
+        self.weights = self.weights[entries]
+        self.entry_rows = np.repeat(np.arange(len(self.ids)), lengths)
+        self.live = np.ones(len(self.ids), bool)
+        self.rows = dict(zip(self.ids.tolist(), range(len(self.ids))))
+        self.retired = 0
+
+    def top(self, query, k=10):
+        """Best ``k`` ``(candidate_id, score)`` pairs for ``{feature: weight}``, best first"""
+        vector = np.zeros(len(self.features), np.float32)
+        for feature, weight in query.items():
+            if feature in self.features:
+                vector[self.features[feature]] = weight
+        norm = np.linalg.norm(vector)
+        with self.lock:
+            if self.pending:
+                self._merge()
+            if norm == 0 or not len(self.ids):
+                return []
+            scores = np.bincount(self.entry_rows, self.weights * vector[self.indices], len(self.ids))
+            scores[~self.live] = 0
+            ids = self.ids
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(ids[row]), float(scores[row] / norm)) for row in best if scores[row] > 0]
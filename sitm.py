@@ -1,15 +1,25 @@
 import streamlit as st
 import pandas as pd
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import requests
-from datetime import datetime
-import base64
+from datetime import datetime, timedelta
 import plotly.express as px
-from PIL import Image
 import io
+import logging
+from payments import PaymentClient, PaymentLedger, iter_payment_events
+from campaigns import CampaignOutbox, PERSONALIZATION_TAGS, SuppressionList, normalize_emails, run_campaign_shard
+import queue
+import hashlib
+import threading
+import multiprocessing
+import re
+import wave
+import difflib
+from concurrent.futures import ThreadPoolExecutor
+import bisect
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
 
 # --------------------------
 # Configuration
@@ -22,74 +32,665 @@ st.set_page_config(
 )
 
 # --------------------------
-# Utility Functions
+# Campaign Resources
 # --------------------------
-def send_bulk_emails(subject, message, contacts_df):
-    """Send bulk emails to a list of contacts"""
-    try:
-        smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-        smtp_port = int(os.getenv("SMTP_PORT", 587))
-        email_address = os.getenv("EMAIL_ADDRESS", "your@email.com")
-        email_password = os.getenv("EMAIL_PASSWORD", "yourpassword")
-        
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(email_address, email_password)
-        
-        for _, contact in contacts_df.iterrows():
-            personalized_msg = message.format(
-                first_name=contact.get("first_name", ""),
-                last_name=contact.get("last_name", ""),
-                location=contact.get("location", ""),
-                current_job=contact.get("current_job", "")
-            )
-            
-            msg = MIMEMultipart()
-            msg['From'] = email_address
-            msg['To'] = contact['email']
-            msg['Subject'] = subject
-            msg.attach(MIMEText(personalized_msg, 'plain'))
-            server.send_message(msg)
-        
-        server.quit()
-        return True
-    except Exception as e:
-        st.error(f"Error sending emails: {e}")
+@st.cache_resource
+def get_suppression_list(path):
+    """Process-wide suppression list shared by every session"""
+    return SuppressionList(path)
+
+# --------------------------
+# Audience Loading
+# --------------------------
+AUDIENCE_COLUMNS = ["email"] + PERSONALIZATION_TAGS
+
+def iter_audience_chunks(path, chunk_size=50000):
+    """Stream contacts from a CSV or Parquet file in bounded-size DataFrames.
+
+    Only the columns the campaign can use are read, so peak memory depends
+    on ``chunk_size`` and not on the size of the file.
+    """
+    if path.lower().endswith((".parquet", ".pq")):
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path)
+        columns = [c for c in parquet.schema_arrow.names if c in AUDIENCE_COLUMNS]
+        for batch in parquet.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size, dtype=str,
+                               usecols=lambda column: column in AUDIENCE_COLUMNS)
+
+def count_audience(path):
+    """Count recipients without loading the file.
+
+    Parquet row counts come from the footer metadata. CSV rows are counted
+    by scanning for newlines in fixed-size blocks, which assumes no quoted
+    field contains a line break.
+    """
+    if path.lower().endswith((".parquet", ".pq")):
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(path).metadata.num_rows
+    lines = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        lines += 1
+    return max(lines - 1, 0)
+
+class ContactDeduplicator:
+    """Drop repeat recipients across audiences using a set of seen addresses.
+
+    Each chunk is checked against the set with one hash lookup per row, so
+    deduplicating a stream is O(n) overall. ``dropped`` counts removed
+    duplicates per audience name.
+    """
+
+    def __init__(self):
+        self.seen = set()
+        self.dropped = {}
+
+    def filter(self, chunk, audience):
+        emails = normalize_emails(chunk['email'])
+        # Series.isin would rebuild a hash table from all of `seen` on every chunk
+        keep = ~(emails.duplicated() | emails.map(self.seen.__contains__).astype(bool))
+        self.seen.update(emails[keep])
+        self.dropped[audience] = self.dropped.get(audience, 0) + int((~keep).sum())
+        return chunk[keep].assign(email=emails[keep])
+
+    @property
+    def dropped_total(self):
+        return sum(self.dropped.values())
+
+def iter_audiences(audiences, paths=(), chunk_size=50000, deduplicator=None):
+    """Chain in-memory audiences and audience files into one chunk stream.
+
+    ``audiences`` maps audience names to DataFrames. When a
+    ``deduplicator`` is given, every chunk passes through it first.
+    """
+    sources = [(name, frame) for name, frame in audiences.items()]
+    sources += [(path, None) for path in paths]
+    for name, frame in sources:
+        if frame is None:
+            chunks = iter_audience_chunks(name, chunk_size)
+        else:
+            chunks = (frame.iloc[start:start + chunk_size]
+                      for start in range(0, len(frame), chunk_size))
+        for chunk in chunks:
+            yield deduplicator.filter(chunk, name) if deduplicator else chunk
+
+# --------------------------
+# Campaign Runner
+# --------------------------
+class CampaignJob:
+    """A campaign sharded across worker processes.
+
+    Contacts are streamed by a feeder thread and routed to shards by a hash
+    of the address, so a recipient always lands on the same shard. Shards
+    report per-batch counts and limiter snapshots on a queue which ``poll``
+    folds into ``totals`` and ``limits``; nothing here blocks the Streamlit
+    script thread.
+
+    Workers run ``campaigns.run_campaign_shard`` in fresh interpreters
+    (``forkserver`` where available, otherwise ``spawn``): forking the
+    multi-threaded Streamlit server could copy locks held by its other
+    threads into the child.
+    """
+
+    def __init__(self, subject, message, chunks, total, run="", shards=None):
+        shards = shards or int(os.getenv("CAMPAIGN_SHARDS", min(4, os.cpu_count() or 1)))
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        context = multiprocessing.get_context(method)
+        self.total = total
+        self.subject = subject
+        self.message = message
+        self.run = run
+        self.limiters = {}
+        self.totals = {"processed": 0, "sent": 0, "failed": 0, "reconnects": 0,
+                       "throttled": 0, "suppressed": 0, "elapsed": 0.0}
+        self.errors = []
+        self.finished = set()
+        self.reported = False
+        self.progress = context.Queue()
+        self.inboxes = [context.Queue(maxsize=4) for _ in range(shards)]
+        self.processes = [
+            context.Process(target=run_campaign_shard,
+                            args=(i, shards, subject, message, run, inbox, self.progress),
+                            daemon=True)
+            for i, inbox in enumerate(self.inboxes)
+        ]
+        for process in self.processes:
+            process.start()
+        self.feeder = threading.Thread(target=self._feed, args=(chunks,), daemon=True)
+        self.feeder.start()
+
+    def _feed(self, chunks):
+        shards = len(self.inboxes)
+        try:
+            for chunk in chunks:
+                keys = pd.util.hash_pandas_object(chunk['email'], index=False) % shards
+                for shard, part in chunk.groupby(keys.to_numpy()):
+                    self._put(shard, part)
+                if not any(process.is_alive() for process in self.processes):
+                    break
+        except Exception as e:
+            self.errors.append(f"Audience: {e}")
+        finally:
+            for shard in range(shards):
+                self._put(shard, None)
+
+    def _put(self, shard, item):
+        """Put ``item`` on a shard's inbox, giving up once its process has exited"""
+        while self.processes[shard].is_alive():
+            try:
+                self.inboxes[shard].put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
         return False
 
-def get_calendly_events():
-    """Mock function to simulate fetching Calendly events"""
-    return [
-        {
-            "name": "John Doe",
-            "email": "john@example.com",
-            "phone": "555-123-4567",
-            "date": "2023-12-15 14:30",
-            "type": "Consultation",
-            "notes": "Interested in AWS training"
-        },
-        {
-            "name": "Jane Smith",
-            "email": "jane@example.com",
-            "phone": "555-987-6543",
-            "date": "2023-12-16 10:00",
-            "type": "Career Advice",
-            "notes": "Recent graduate looking for guidance"
+    def poll(self):
+        """Drain progress reports and return the running totals"""
+        while True:
+            try:
+                kind, shard, payload = self.progress.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "batch":
+                for key in self.totals:
+                    self.totals[key] += payload[key]
+            elif kind == "limiter":
+                self.limiters[shard] = payload
+            else:
+                self.finished.add(shard)
+                if kind == "error":
+                    self.errors.append(f"Shard {shard}: {payload}")
+        return self.totals
+
+    @property
+    def limits(self):
+        """Limiter metrics summed over the shards, or None before the first batch"""
+        if not self.limiters:
+            return None
+        snapshots = list(self.limiters.values())
+        return {key: sum(snapshot[key] for snapshot in snapshots)
+                for key in ("rate", "max_rate", "throttled", "waited")}
+
+    def outbox_status(self):
+        """``{state: count}`` for this campaign in the outbox"""
+        outbox = CampaignOutbox.from_env()
+        return outbox.status(outbox.open_campaign(self.subject, self.message, self.run))
+
+    @property
+    def running(self):
+        if len(self.finished) == len(self.processes):
+            return False
+        # A shard that died without reporting still counts as finished
+        return any(process.is_alive() for process in self.processes)
+
+# --------------------------
+# Utility Functions
+# --------------------------
+def show_limiter_metrics(limits):
+    """Rate limit, throttle replies and time spent pacing"""
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Send Rate Limit", f"{limits['rate']:.1f}/s",
+                f"{limits['rate'] - limits['max_rate']:.1f}" if limits['rate'] < limits['max_rate'] else None)
+    col2.metric("Throttle Replies", limits['throttled'])
+    col3.metric("Time Paced", f"{limits['waited']:.1f}s")
+
+SAMPLE_CALENDLY_EVENTS = [
+    {
+        "name": "John Doe",
+        "email": "john@example.com",
+        "phone": "555-123-4567",
+        "date": "2023-12-15 14:30",
+        "type": "Consultation",
+        "notes": "Interested in AWS training"
+    },
+    {
+        "name": "Jane Smith",
+        "email": "jane@example.com",
+        "phone": "555-987-6543",
+        "date": "2023-12-16 10:00",
+        "type": "Career Advice",
+        "notes": "Recent graduate looking for guidance"
+    }
+]
+
+class CalendlySync:
+    """Local copy of scheduled events kept current by incremental fetches.
+
+    Each ``refresh`` asks only for events updated after the newest
+    ``updated_at`` already seen and merges them into the store by event
+    URI; canceled events are dropped. When Calendly cannot be reached the
+    last merged events are returned and ``error`` says why.
+    ``CALENDLY_API_URL`` can point at a local stub server for testing.
+    """
+
+    def __init__(self, base_url, token, user, page_size=100):
+        self.base_url = base_url.rstrip("/")
+        self.user = user
+        self.page_size = page_size
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {token}"
+        self.events = {}
+        self.cursor = None
+        self.error = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _appointment(event):
+        """Appointment dict with ``start`` as a naive local datetime, or None if it has no usable start"""
+        invitee = (event.get("invitees") or [{}])[0]
+        try:
+            start = datetime.fromisoformat((event.get("start_time") or "").replace("Z", "+00:00"))
+        except ValueError:
+            logger.warning("Skipping Calendly event %s with start_time %r", event.get("uri"), event.get("start_time"))
+            return None
+        # Calendly reports UTC; the bookings page compares against local time
+        start = start.astimezone().replace(tzinfo=None) if start.tzinfo else start
+        return {
+            "name": invitee.get("name", ""),
+            "email": invitee.get("email", ""),
+            "phone": invitee.get("text_reminder_number") or "",
+            "start": start,
+            "date": start.strftime("%Y-%m-%d %H:%M"),
+            "type": event.get("name", ""),
+            "notes": event.get("meeting_notes_plain") or "",
         }
-    ]
 
-def create_payment_link(amount, description, customer):
-    """Mock function to simulate payment link creation"""
-    return "https://checkout.stripe.com/pay/test_link"
+    def refresh(self):
+        """Fetch changes since the last cursor and return all appointments"""
+        with self.lock:
+            url = f"{self.base_url}/scheduled_events"
+            params = {"user": self.user, "count": self.page_size, "sort": "updated_at:asc"}
+            if self.cursor:
+                params["updated_at_min"] = self.cursor
+            cursor = self.cursor
+            try:
+                while url:
+                    response = self.session.get(url, params=params, timeout=10)
+                    response.raise_for_status()
+                    body = response.json()
+                    for event in body.get("collection", []):
+                        appointment = None if event.get("status") == "canceled" else self._appointment(event)
+                        if appointment is None:
+                            self.events.pop(event["uri"], None)
+                        else:
+                            self.events[event["uri"]] = appointment
+                        cursor = max(cursor or "", event.get("updated_at", ""))
+                    url = body.get("pagination", {}).get("next_page")
+                    params = None
+            except requests.RequestException as e:
+                # Keep the cursor so the next refresh fetches these pages again
+                logger.warning("Calendly refresh failed: %s", e)
+                self.error = str(e)
+            else:
+                self.cursor = cursor
+                self.error = None
+            return sorted(self.events.values(), key=lambda appt: appt["start"])
+
+@st.cache_resource
+def get_calendly_sync():
+    """Event store shared by every session in this process"""
+    return CalendlySync(
+        os.getenv("CALENDLY_API_URL", "https://api.calendly.com"),
+        os.getenv("CALENDLY_TOKEN", ""),
+        os.getenv("CALENDLY_USER", "")
+    )
+
+@st.cache_data(ttl=int(os.getenv("CALENDLY_CACHE_TTL", 60)), show_spinner=False)
+def get_calendly_events():
+    """Fetch upcoming appointments, falling back to sample data without a token"""
+    if not os.getenv("CALENDLY_TOKEN"):
+        return SAMPLE_CALENDLY_EVENTS
+    return get_calendly_sync().refresh()
+
+class AppointmentIndex:
+    """Appointments sorted by start time for range queries.
+
+    Sorting happens once at build time; ``between`` then finds a window
+    with two binary searches and returns only the matching slice.
+    """
+
+    def __init__(self, appointments):
+        keyed = []
+        self.skipped = 0
+        for appt in appointments:
+            start = appt.get("start")
+            if start is None:
+                try:
+                    start = datetime.strptime(appt.get("date") or "", "%Y-%m-%d %H:%M")
+                except ValueError:
+                    logger.warning("Skipping appointment with unreadable date %r", appt.get("date"))
+                    self.skipped += 1
+                    continue
+            keyed.append((start, appt))
+        keyed.sort(key=lambda item: item[0])
+        self.starts = [start for start, _ in keyed]
+        self.appointments = [appt for _, appt in keyed]
+
+    def __len__(self):
+        return len(self.appointments)
+
+    def between(self, start=None, end=None):
+        """Appointments with ``start <= date < end``; ``None`` leaves a side open"""
+        lo = bisect.bisect_left(self.starts, start) if start else 0
+        hi = bisect.bisect_left(self.starts, end) if end else len(self.starts)
+        return self.appointments[lo:hi]
+
+@st.cache_resource(ttl=int(os.getenv("CALENDLY_CACHE_TTL", 60)), show_spinner=False)
+def get_appointment_index():
+    """Shared, read-only index over the current appointments"""
+    return AppointmentIndex(get_calendly_events())
+
+@st.cache_resource
+def get_payment_ledger():
+    """Issued links and reconciled payments, shared by every session"""
+    return PaymentLedger(os.getenv("PAYMENTS_DB", "sitm_payments.db"))
+
+@st.cache_resource
+def get_payment_client():
+    """Shared payment client, or ``None`` when no provider is configured"""
+    if not os.getenv("PAYMENT_API_URL"):
+        return None
+    return PaymentClient(os.getenv("PAYMENT_API_URL"), os.getenv("PAYMENT_API_KEY", ""),
+                         ledger=get_payment_ledger())
+
+def create_payment_link(amount, description, customer, course="", plan=""):
+    """Create a payment link, reusing the one already issued for this customer, course and plan"""
+    client = get_payment_client()
+    if client is None:
+        return "https://checkout.stripe.com/pay/test_link"
+    return client.create_link(amount, description, customer, course, plan)
 
 def generate_audio(text):
     """Generate simple audio without external dependencies"""
     # In a real implementation, you would use a proper TTS service
-    # This is just a placeholder that returns a sample audio
-    audio_base64 = """
-    UklGRl9vT19XQVZFZm10IBAAAAABAAEAQB8AAEAfAAABAAgAZGF0YU...
-    """  # Truncated for brevity
-    return io.BytesIO(base64.b64decode(audio_base64))
+    # This is just a placeholder: a silent 8 kHz mono clip, roughly as long as reading the text
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(1)
+        writer.setframerate(8000)
+        writer.writeframes(b"\x80" * (8000 * max(1, len(text) // 15)))
+    buffer.seek(0)
+    return buffer
+
+class AudioCache:
+    """Content-addressed voiceover cache with memory and disk tiers.
+
+    Clips are keyed by a SHA-256 of the text, stored as ``<key>.wav`` files
+    and evicted least-recently-used once the directory exceeds
+    ``max_bytes``. The most recent ``memory_entries`` clips are also kept
+    in memory so hot posts never touch disk.
+    """
+
+    def __init__(self, directory, max_bytes, memory_entries=32):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # Disk entries in least- to most-recently-used order
+        entries = sorted(
+            (entry for entry in os.scandir(directory) if entry.name.endswith(".wav")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        self.sizes = OrderedDict((entry.name[:-4], entry.stat().st_size) for entry in entries)
+
+    @staticmethod
+    def key(text):
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.wav")
+
+    def _remember(self, key, audio):
+        self.memory[key] = audio
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, text):
+        """Return cached audio bytes for ``text`` or ``None``"""
+        key = self.key(text)
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.sizes.move_to_end(key)
+                return self.memory[key]
+            if key not in self.sizes:
+                return None
+            try:
+                with open(self._path(key), "rb") as f:
+                    audio = f.read()
+                os.utime(self._path(key))
+            except FileNotFoundError:
+                del self.sizes[key]
+                return None
+            self.sizes.move_to_end(key)
+            self._remember(key, audio)
+            return audio
+
+    def put(self, text, audio):
+        key = self.key(text)
+        tmp = self.temp_path(text)
+        with open(tmp, "wb") as f:
+            f.write(audio)
+        os.replace(tmp, self._path(key))
+        with self.lock:
+            self.sizes[key] = len(audio)
+            self.sizes.move_to_end(key)
+            self._remember(key, audio)
+            self._evict()
+
+    def temp_path(self, text):
+        """Scratch file to build a clip in before ``put_file``"""
+        return self._path(self.key(text)) + f".{threading.get_ident()}.tmp"
+
+    def put_file(self, text, tmp):
+        """Move a finished clip written to ``temp_path`` into the cache"""
+        key = self.key(text)
+        os.replace(tmp, self._path(key))
+        with self.lock:
+            self.sizes[key] = os.path.getsize(self._path(key))
+            self.sizes.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        total = sum(self.sizes.values())
+        while total > self.max_bytes and len(self.sizes) > 1:
+            key, size = self.sizes.popitem(last=False)
+            total -= size
+            self.memory.pop(key, None)
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def get_or_create(self, text, synthesize):
+        audio = self.get(text)
+        if audio is None:
+            audio = synthesize(text)
+            self.put(text, audio)
+        return audio
+
+@st.cache_resource
+def get_audio_cache():
+    """Voiceover cache shared by every session"""
+    return AudioCache(
+        os.getenv("AUDIO_CACHE_DIR", ".audio_cache"),
+        int(os.getenv("AUDIO_CACHE_MAX_MB", 256)) * 1024 * 1024
+    )
+
+def split_sentences(text, max_chars=400):
+    """Split text into chunks of whole sentences, each at most ``max_chars``.
+
+    A single sentence longer than ``max_chars`` is split on whitespace.
+    """
+    chunks = []
+    current = ""
+    for sentence in re.split(r"(?<=[.!?])\s+|\n{2,}", text.strip()):
+        sentence = sentence.strip()
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:cut])
+            sentence = sentence[cut:].strip()
+        if not sentence:
+            continue
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+def synthesize_chunks(text, synthesize, workers=4, max_chars=400):
+    """Yield WAV clips for each sentence chunk of ``text`` in order.
+
+    Chunks are synthesized concurrently, but at most ``2 * workers`` are in
+    flight, so memory stays bounded however long the text is.
+    """
+    pending = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for chunk in split_sentences(text, max_chars):
+            pending.append(pool.submit(synthesize, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+def get_voiceover(text):
+    """Voiceover WAV bytes for ``text``, synthesized only on a cache miss"""
+    return get_audio_cache().get_or_create(text, lambda t: generate_audio(t).getvalue())
+
+def stream_voiceover(text, max_chars=400):
+    """Yield playable WAV parts for ``text`` as soon as each is ready.
+
+    Short text and cache hits come back as a single clip. Otherwise the
+    parts are synthesized concurrently and yielded in order, and their
+    frames are appended to the cache file as they arrive, so only the
+    parts in flight are ever held in memory.
+    """
+    cache = get_audio_cache()
+    audio = cache.get(text)
+    if audio is not None or len(text) <= max_chars:
+        yield audio if audio is not None else get_voiceover(text)
+        return
+    tmp = cache.temp_path(text)
+    writer = None
+    try:
+        for clip in synthesize_chunks(text, lambda t: generate_audio(t).getvalue(), max_chars=max_chars):
+            with wave.open(io.BytesIO(clip)) as reader:
+                if writer is None:
+                    writer = wave.open(tmp, "wb")
+                    writer.setparams(reader.getparams())
+                writer.writeframes(reader.readframes(reader.getnframes()))
+            yield clip
+        if writer is not None:
+            writer.close()
+            writer = None
+            cache.put_file(text, tmp)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+COURSES = {
+    "Operating Systems": [
+        {"name": "Linux Administration", "duration": "6 weeks", "level": "Intermediate", "price": "$1,200"},
+        {"name": "Windows Server", "duration": "4 weeks", "level": "Beginner", "price": "$950"}
+    ],
+    "Databases": [
+        {"name": "Oracle DBA", "duration": "8 weeks", "level": "Advanced", "price": "$1,800"},
+        {"name": "MySQL Fundamentals", "duration": "4 weeks", "level": "Beginner", "price": "$850"}
+    ],
+    "DevOps": [
+        {"name": "Docker & Kubernetes", "duration": "6 weeks", "level": "Intermediate", "price": "$1,500"},
+        {"name": "Terraform & Ansible", "duration": "5 weeks", "level": "Intermediate", "price": "$1,350"}
+    ]
+}
+
+class CourseIndex:
+    """Search index over the course catalog.
+
+    Every prefix of every word in a course name maps to the courses that
+    contain it, so a prefix query is a dictionary lookup per word. Words
+    with no prefix hit fall back to fuzzy matching against the vocabulary,
+    which is much smaller than the catalog.
+    """
+
+    def __init__(self, catalog):
+        self.courses = []
+        self.prefixes = {}
+        for category, items in catalog.items():
+            for course in items:
+                course = dict(course, category=category,
+                              price_value=int(re.sub(r"[^0-9]", "", course["price"]) or 0))
+                course_id = len(self.courses)
+                self.courses.append(course)
+                for word in self.tokenize(course["name"]):
+                    for end in range(1, len(word) + 1):
+                        self.prefixes.setdefault(word[:end], set()).add(course_id)
+        self.vocabulary = sorted({
+            word for course in self.courses for word in self.tokenize(course["name"])
+        })
+        self.categories = list(catalog.keys())
+        self.levels = sorted({course["level"] for course in self.courses})
+        prices = [course["price_value"] for course in self.courses] or [0]
+        self.price_range = (min(prices), max(prices))
+
+    @staticmethod
+    def tokenize(text):
+        return re.findall(r"[a-z0-9]+", text.lower())
+
+    def _match_word(self, word):
+        if word in self.prefixes:
+            return self.prefixes[word]
+        matches = set()
+        for close in difflib.get_close_matches(word, self.vocabulary, n=5, cutoff=0.75):
+            matches |= self.prefixes[close]
+        return matches
+
+    def search(self, query="", category=None, levels=None, max_price=None):
+        """Courses matching every query word and the given filters, in catalog order"""
+        ids = None
+        for word in self.tokenize(query):
+            matches = self._match_word(word)
+            ids = matches if ids is None else ids & matches
+        candidates = range(len(self.courses)) if ids is None else sorted(ids)
+        return [
+            self.courses[i] for i in candidates
+            if (not category or self.courses[i]["category"] == category)
+            and (not levels or self.courses[i]["level"] in levels)
+            and (max_price is None or self.courses[i]["price_value"] <= max_price)
+        ]
+
+@st.cache_resource
+def get_course_index():
+    """Course index built once per process and shared by every session"""
+    return CourseIndex(COURSES)
+
+def paginate(total, key, page_size):
+    """Render a page picker and return the ``(start, end)`` slice to show"""
+    pages = max(1, (total - 1) // page_size + 1)
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=key) if pages > 1 else 1
+    start = (page - 1) * page_size
+    return start, min(start + page_size, total)
 
 # --------------------------
 # Page Functions
@@ -139,24 +740,113 @@ Book a free consultation: [Insert Calendly Link]
     
     with col2:
         st.markdown("**Personalization Tags**")
-        st.code("{first_name}\n{last_name}\n{location}\n{current_job}")
+        st.code("\n".join(f"{{{tag}}}" for tag in PERSONALIZATION_TAGS))
+    
+    with st.expander("Suppression List"):
+        suppressions = get_suppression_list(os.getenv("OUTBOX_PATH", "sitm_outbox.db"))
+        st.write(f"{len(suppressions)} suppressed addresses")
+        reason = st.selectbox("Reason", ["unsubscribe", "bounce"])
+        suppression_file = st.file_uploader("Upload addresses (CSV with an email column)", type="csv")
+        if suppression_file and st.button("Add to Suppression List"):
+            added = 0
+            for chunk in pd.read_csv(suppression_file, usecols=["email"], dtype=str, chunksize=50000):
+                added += suppressions.add(chunk["email"].dropna(), reason)
+            st.success(f"Added {added} addresses to the suppression list")
+    
+    audience_file = st.text_input("Audience file (CSV or Parquet path):")
+    audience_paths = [audience_file] if audience_file else []
+    
+    # A new run name sends the same content again; an unfinished run can be resumed
+    unfinished = CampaignOutbox.from_env().unfinished_run(subject, message)
+    if unfinished is not None and st.checkbox(
+            f"Resume unfinished run \"{unfinished or 'unnamed'}\"", value=True):
+        run = unfinished
+    else:
+        st.session_state.setdefault('campaign_run', datetime.now().strftime("%Y-%m-%d %H:%M"))
+        run = st.text_input("Run name:", key='campaign_run')
     
     if st.button("Review & Send Campaign"):
-        combined_df = pd.concat([audience_options[audience] for audience in selected_audiences])
-        st.success(f"Ready to send to {len(combined_df)} contacts!")
+        audiences = {audience: audience_options[audience] for audience in selected_audiences}
+        st.session_state.pop('campaign_total', None)
+        try:
+            st.session_state['campaign_total'] = (
+                sum(len(frame) for frame in audiences.values()) + sum(count_audience(path) for path in audience_paths)
+            )
+        except (OSError, ValueError, ImportError) as e:
+            st.error(f"Could not read audience file {audience_file}: {e}")
+    
+    if 'campaign_total' in st.session_state:
+        st.success(f"Ready to send to {st.session_state['campaign_total']} contacts!")
         
         if st.button("Confirm Send"):
-            if send_bulk_emails(subject, message, combined_df):
-                st.success("Campaign sent successfully!")
+            audiences = {audience: audience_options[audience] for audience in selected_audiences}
+            deduplicator = ContactDeduplicator()
+            contacts = iter_audiences(audiences, audience_paths, deduplicator=deduplicator)
+            st.session_state['campaign_job'] = CampaignJob(
+                subject, message, contacts, st.session_state.pop('campaign_total'), run=run
+            )
+            st.session_state.pop('campaign_run', None)
+            st.session_state['campaign_dedup'] = deduplicator
+    
+    campaign_progress()
+
+@st.fragment(run_every=1)
+def campaign_progress():
+    """Show live progress for the session's running campaign"""
+    job = st.session_state.get('campaign_job')
+    if job is None:
+        return
+    running = job.running
+    totals = job.poll()
+    done = totals["processed"] + st.session_state['campaign_dedup'].dropped_total
+    st.progress(min(1.0, done / job.total) if job.total else 1.0,
+                text=f"{totals['sent']} sent, {totals['failed']} failed, "
+                     f"{totals['suppressed']} suppressed of {job.total}")
+    if job.limits:
+        show_limiter_metrics(job.limits)
+    if running:
+        return
+    if not job.reported:
+        # Shards add bounces to the table directly; refresh the shared filter
+        get_suppression_list(os.getenv("OUTBOX_PATH", "sitm_outbox.db")).rebuild()
+        job.final_status = job.outbox_status()
+        job.reported = True
+    for error in job.errors:
+        st.error(f"Error sending emails: {error}")
+    if not job.errors and not totals["failed"]:
+        st.success("Campaign sent successfully!")
+    status = job.final_status
+    st.info(f"Campaign totals: {status['sent']} sent, {status['failed']} failed, {status['queued']} queued")
+    for audience, dropped in st.session_state['campaign_dedup'].dropped.items():
+        if dropped:
+            st.caption(f"Skipped {dropped} duplicate contacts from {audience}")
 
 def bookings_page():
     st.title("📅 Appointment Scheduling")
     
     st.subheader("Upcoming Appointments")
-    appointments = get_calendly_events()
+    index = get_appointment_index()
+    if os.getenv("CALENDLY_TOKEN") and get_calendly_sync().error:
+        st.warning(f"Could not reach Calendly, showing the last synced appointments: {get_calendly_sync().error}")
+    
+    now = datetime.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    month_start = today.replace(day=1)
+    ranges = {
+        "All": (None, None),
+        "Upcoming": (now, None),
+        "Next 7 days": (now, now + timedelta(days=7)),
+        "This month": (month_start, (month_start + timedelta(days=32)).replace(day=1)),
+    }
+    col1, col2 = st.columns([3, 1])
+    window = col1.radio("Show:", list(ranges.keys()), horizontal=True)
+    page_size = col2.selectbox("Per page", [10, 25, 50], index=1)
+    appointments = index.between(*ranges[window])
     
     if appointments:
-        for appt in appointments:
+        start, end = paginate(len(appointments), "appointments_page", page_size)
+        st.caption(f"Showing {start + 1}-{end} of {len(appointments)} appointments")
+        for appt in appointments[start:end]:
             with st.expander(f"{appt['name']} - {appt['date']}"):
                 st.write(f"**Email:** {appt['email']}")
                 st.write(f"**Phone:** {appt['phone']}")
@@ -164,6 +854,8 @@ def bookings_page():
                 st.write(f"**Notes:** {appt['notes']}")
     else:
         st.info("No upcoming appointments found.")
+    if index.skipped:
+        st.caption(f"{index.skipped} appointments with an unreadable date are not shown")
     
     st.subheader("Book New Appointment")
     st.markdown("""
@@ -194,10 +886,14 @@ def payments_page():
             "Oracle DBA",
             "DevOps Engineering"
         ])
+        if plan == "📅 Custom Payment Plan":
+            custom_amount = st.number_input("Custom Amount", min_value=500, max_value=3500)
         
         submitted = st.form_submit_button("Generate Payment Link")
         
-        if submitted:
+        if submitted and not email.strip():
+            st.warning("Please enter the student's email so the payment can be matched to the enrollment.")
+        elif submitted:
             if plan == "💰 Full Payment ($3,500 - Save $500)":
                 amount = 3500
                 description = f"Full payment for {course}"
@@ -205,67 +901,79 @@ def payments_page():
                 amount = 1500
                 description = f"First installment for {course}"
             else:
-                amount = st.number_input("Custom Amount", min_value=500, max_value=3500)
+                amount = custom_amount
                 description = f"Custom payment for {course}"
             
             payment_link = create_payment_link(amount, description, {
                 "first_name": first_name,
                 "last_name": last_name,
-                "email": email,
+                "email": email.strip(),
                 "phone": phone
-            })
+            }, course=course, plan=plan)
             
             st.success("Payment link generated!")
             st.markdown(f"""
             ### Payment Instructions
             [Click here to complete your payment]({payment_link})
             """)
+    
+    st.markdown("---")
+    st.subheader("Payment Reconciliation")
+    ledger = get_payment_ledger()
+    events_file = st.text_input("Payment events export (CSV or JSON lines path):")
+    if events_file and st.button("Reconcile Payments"):
+        with st.spinner("Reconciling payments..."):
+            stats = ledger.reconcile(iter_payment_events(events_file), units="currency")
+        st.success(f"Processed {stats['events']} events: {stats['matched']} matched, "
+                   f"{stats['unmatched']} unmatched, {stats['duplicates']} already seen")
+        if stats["invalid"]:
+            st.warning(f"Skipped {stats['invalid']} events with a missing id or unreadable amount")
+    counts = ledger.enrollment_counts()
+    col1, col2 = st.columns(2)
+    col1.metric("Enrolled (paid)", counts.get("enrolled", 0))
+    col2.metric("Refunded", counts.get("refunded", 0))
 
 def training_page():
     st.title("📚 Training Programs")
     
-    courses = {
-        "Operating Systems": [
-            {"name": "Linux Administration", "duration": "6 weeks", "level": "Intermediate", "price": "$1,200"},
-            {"name": "Windows Server", "duration": "4 weeks", "level": "Beginner", "price": "$950"}
-        ],
-        "Databases": [
-            {"name": "Oracle DBA", "duration": "8 weeks", "level": "Advanced", "price": "$1,800"},
-            {"name": "MySQL Fundamentals", "duration": "4 weeks", "level": "Beginner", "price": "$850"}
-        ],
-        "DevOps": [
-            {"name": "Docker & Kubernetes", "duration": "6 weeks", "level": "Intermediate", "price": "$1,500"},
-            {"name": "Terraform & Ansible", "duration": "5 weeks", "level": "Intermediate", "price": "$1,350"}
-        ]
-    }
-    
-    selected_category = st.sidebar.selectbox("Category", ["All"] + list(courses.keys()))
+    index = get_course_index()
+    selected_category = st.sidebar.selectbox("Category", ["All"] + index.categories)
     search_query = st.sidebar.text_input("Search Courses")
+    levels = st.sidebar.multiselect("Level", index.levels)
+    low, high = index.price_range
+    max_price = st.sidebar.slider("Max Price ($)", low, high, high) if low < high else None
     
-    if selected_category == "All":
-        for category, items in courses.items():
-            st.subheader(category)
-            for course in items:
-                if not search_query or search_query.lower() in course["name"].lower():
-                    with st.expander(f"🎯 {course['name']} - {course['duration']}"):
-                        st.markdown(f"""
-                        **Level:** {course['level']}  
-                        **Price:** {course['price']}
-                        """)
-                        if st.button("Enroll Now", key=f"enroll_{course['name']}"):
-                            st.session_state['selected_course'] = course
+    results = index.search(
+        search_query,
+        category=None if selected_category == "All" else selected_category,
+        levels=levels,
+        max_price=max_price
+    )
     
-    else:
-        st.subheader(selected_category)
-        for course in courses[selected_category]:
-            if not search_query or search_query.lower() in course["name"].lower():
-                with st.expander(f"🎯 {course['name']} - {course['duration']}"):
-                    st.markdown(f"""
-                    **Level:** {course['level']}  
-                    **Price:** {course['price']}
-                    """)
-                    if st.button("Enroll Now", key=f"enroll_{course['name']}"):
-                        st.session_state['selected_course'] = course
+    course_list(results)
+
+@st.fragment
+def course_list(results):
+    """One page of course results plus the enrollment form.
+
+    Running as a fragment means an "Enroll Now" click or page change
+    reruns only this section, not the whole training page.
+    """
+    if not results:
+        st.info("No courses match your search.")
+    start, end = paginate(len(results), "course_page", 20)
+    category = None
+    for course in results[start:end]:
+        if course["category"] != category:
+            category = course["category"]
+            st.subheader(category)
+        with st.expander(f"🎯 {course['name']} - {course['duration']}"):
+            st.markdown(f"""
+            **Level:** {course['level']}  
+            **Price:** {course['price']}
+            """)
+            if st.button("Enroll Now", key=f"enroll_{course['name']}"):
+                st.session_state['selected_course'] = course
     
     if 'selected_course' in st.session_state:
         st.subheader(f"Enroll in {st.session_state['selected_course']['name']}")
@@ -295,7 +1003,7 @@ def social_media_page():
     tone = st.selectbox("Tone", ["Professional", "Motivational", "George Carlin-style"])
     
     if st.button("Generate Post"):
-        sample_post = f"""🚀 {topic} with SolidITMinds!
+        st.session_state['generated_post'] = f"""🚀 {topic} with SolidITMinds!
 
 We can train you for a six-figure IT career in just 90-120 days. No fluff, just results.
 
@@ -305,13 +1013,32 @@ We can train you for a six-figure IT career in just 90-120 days. No fluff, just
 
 Ready to transform your career? DM us or visit soliditminds.com"""
 
+    # Kept in the session so the voiceover button still has the post on its own rerun
+    if 'generated_post' in st.session_state:
+        sample_post = st.session_state['generated_post']
         st.text_area("Generated Post", sample_post, height=200)
         st.markdown("**Suggested Hashtags:**")
         st.code("#ITCareer #TechJobs #CloudComputing #DevOps #SixFigureSalary")
-        
-        if st.button("Generate Voiceover"):
-            audio_file = generate_audio(sample_post)
-            st.audio(audio_file, format="audio/wav")
+
+    if 'generated_post' in st.session_state and st.button("Generate Voiceover"):
+        # Play the first part right away; the full clip replaces the status once it is cached
+        status = st.empty()
+        i = 0
+        try:
+            for i, part in enumerate(stream_voiceover(sample_post)):
+                if i == 0:
+                    st.audio(part, format="audio/wav")
+                    status.caption("Synthesizing the rest of the voiceover...")
+                else:
+                    status.caption(f"Synthesized {i + 1} parts...")
+        except Exception as e:
+            status.empty()
+            st.error(f"Error generating voiceover: {e}")
+        else:
+            if i > 0:
+                status.empty()
+                st.markdown("**Full voiceover**")
+                st.audio(get_audio_cache().get(sample_post), format="audio/wav")
 
 def monitoring_page():
     st.title("📊 Performance Monitoring Dashboard")
@@ -341,17 +1068,32 @@ def crm_page():
     st.title("🤝 CRM Dashboard")
     
     st.subheader("Lead Management")
+    leads = pd.DataFrame({
+        "Name": ["John Doe", "Jane Smith"],
+        "Email": ["john@example.com", "jane@example.com"],
+        "Status": ["Contacted", "New"],
+        "Source": ["Website", "Referral"]
+    })
     tab1, tab2, tab3 = st.tabs(["All Leads", "New", "Converted"])
     
     with tab1:
-        st.dataframe(pd.DataFrame({
-            "Name": ["John Doe", "Jane Smith"],
-            "Email": ["john@example.com", "jane@example.com"],
-            "Status": ["Contacted", "New"],
-            "Source": ["Website", "Referral"]
-        }))
+        leads_table(leads, "all")
+    with tab2:
+        leads_table(leads[leads["Status"] == "New"], "new")
+    with tab3:
+        leads_table(leads[leads["Status"] == "Converted"], "converted")
     
     st.subheader("Student Tracking")
+    student_tracking()
+
+@st.fragment
+def leads_table(leads, key, page_size=50):
+    """Show one page of leads; paging reruns only this table"""
+    start, end = paginate(len(leads), f"leads_page_{key}", page_size)
+    st.dataframe(leads.iloc[start:end])
+
+@st.fragment
+def student_tracking():
     student = st.selectbox("Select Student", ["John Doe", "Jane Smith"])
     
     if student: